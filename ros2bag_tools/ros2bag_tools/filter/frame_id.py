@@ -1,3 +1,6 @@
+from functools import lru_cache
+import struct
+
 from rclpy.serialization import deserialize_message
 from rclpy.serialization import serialize_message
 
@@ -9,12 +12,127 @@ from rosidl_runtime_py.utilities import get_message
 import yaml
 
 
+# representation identifier of little endian CDR, as written by rmw
+CDR_LE = b'\x00\x01'
+# encapsulation header (4 bytes) followed by header.stamp (sec + nanosec)
+FRAME_ID_OFFSET = 12
+
+
+@lru_cache(maxsize=None)
+def load_message_type(type_name: str):
+    """Import a message type once, topics of the same type share the result."""
+    return get_message(type_name)
+
+
+def encode_cdr_string(value: str) -> bytes:
+    """Encode a string as CDR: uint32 length including terminator, data, NUL."""
+    raw = value.encode() + b'\x00'
+    return struct.pack('<I', len(raw)) + raw
+
+
+def has_leading_header(msg_type) -> bool:
+    """Check if header (std_msgs/Header) is the first field of a message type."""
+    fields = iter(msg_type.get_fields_and_field_types().items())
+    return next(fields, None) == ('header', 'std_msgs/Header')
+
+
+def patch_frame_id(data: bytes, old, new: bytes):
+    """
+    Replace header.frame_id of a serialized message without deserializing it.
+
+    The message type must have the header as its first field. old is the encoded frame_id to
+    match, or None to match any. Returns the patched data, the unchanged data if old did not
+    match, or None if the replacement cannot be done in place.
+    """
+    if data[:2] != CDR_LE:
+        return None
+    (length,) = struct.unpack_from('<I', data, FRAME_ID_OFFSET)
+    end = FRAME_ID_OFFSET + 4 + length
+    if old is not None:
+        if data[FRAME_ID_OFFSET:end] != old:
+            return data
+        if old == new:
+            return data
+    # fields after the header keep their CDR alignment only if they are shifted by a
+    # multiple of the maximum alignment (8 bytes)
+    if (len(new) - (end - FRAME_ID_OFFSET)) % 8 != 0:
+        return None
+    view = memoryview(data)
+    return b''.join((view[:FRAME_ID_OFFSET], new, view[end:]))
+
+
+def parse_replacement(value: str, name: str):
+    """Parse old:new into (old, new), old is None for the wildcard *."""
+    if ':' not in value:
+        raise RuntimeError(f'{name} must be specified as old:new')
+    old, new = value.split(':', 1)
+    return (None if old == '*' else old, new)
+
+
+def make_patcher(frame_id, child_frame_id, msg_type):
+    """
+    Create a function replacing frame ids of deserialized messages of msg_type.
+
+    The fields of the message type are probed once, so the returned function does not need to
+    check for them on every message. Returns None if no replacement applies to msg_type.
+    """
+    sample = msg_type()
+    if not (hasattr(sample, 'header') and hasattr(sample.header, 'frame_id')):
+        frame_id = None
+    if not hasattr(sample, 'child_frame_id'):
+        child_frame_id = None
+    if frame_id is None and child_frame_id is None:
+        return None
+
+    def patch(msg):
+        if frame_id is not None:
+            old, new = frame_id
+            if old is None or msg.header.frame_id == old:
+                msg.header.frame_id = new
+        if child_frame_id is not None:
+            old, new = child_frame_id
+            if old is None or msg.child_frame_id == old:
+                msg.child_frame_id = new
+    return patch
+
+
+def make_handler(frame_id, child_frame_id, frame_id_cdr, msg_type):
+    """
+    Create a function filtering serialized messages of one topic.
+
+    Returns None if the topic's messages stay unchanged.
+    """
+    patch = make_patcher(frame_id, child_frame_id, msg_type)
+    if patch is None:
+        return None
+
+    def deserialize_and_patch(topic, data, t):
+        msg = deserialize_message(data, msg_type)
+        patch(msg)
+        return (topic, serialize_message(msg), t)
+
+    if frame_id_cdr is None or child_frame_id is not None or not has_leading_header(msg_type):
+        return deserialize_and_patch
+
+    old, new = frame_id_cdr
+
+    def patch_in_place(topic, data, t):
+        patched = patch_frame_id(data, old, new)
+        if patched is None:
+            return deserialize_and_patch(topic, data, t)
+        return (topic, patched, t)
+    return patch_in_place
+
+
 class FrameIdFilter(FilterExtension):
 
     def __init__(self):
         self._args = None
-        self._msg_module = None
         self._values_dictionary = {}
+        # topic -> (frame_id, child_frame_id, CDR encoded frame_id) replacements
+        self._topic_map = {}
+        # topic -> function filtering its serialized messages
+        self._handlers = {}
 
     def add_arguments(self, parser):
         parser.add_argument('-t','--topic', action='append', required=True, help='topic to replace data for (can be repeated)')
@@ -30,44 +148,34 @@ class FrameIdFilter(FilterExtension):
         frame_ids = args.frame_id or [None] * num_topics
         child_frame_ids = args.child_frame_id or [None] * num_topics
         for i, topic in enumerate(args.topic):
-            mapping = {}
+            frame_id = None
+            frame_id_cdr = None
+            child_frame_id = None
             if frame_ids[i]:
-                if ':' not in frame_ids[i]:
-                    raise RuntimeError('frame_id must be specified as old:new')
-                old, new = frame_ids[i].split(':', 1)
-                mapping['frame_id'] = (old, new)
+                frame_id = parse_replacement(frame_ids[i], 'frame_id')
+                # CDR encoded strings for patching serialized messages in place
+                old, new = frame_id
+                frame_id_cdr = (None if old is None else encode_cdr_string(old),
+                                encode_cdr_string(new))
             if child_frame_ids[i]:
-                if ':' not in child_frame_ids[i]:
-                    raise RuntimeError('child_frame_id must be specified as old:new')
-                old, new = child_frame_ids[i].split(':', 1)
-                mapping['child_frame_id'] = (old, new)
-            self._topic_map[topic] = mapping
+                child_frame_id = parse_replacement(child_frame_ids[i], 'child_frame_id')
+            self._topic_map[topic] = (frame_id, child_frame_id, frame_id_cdr)
 
     def filter_topic(self, topic_metadata):
         topic = topic_metadata.name
         if topic in self._topic_map:
             try:
-                self._msg_module = get_message(topic_metadata.type)
+                msg_module = load_message_type(topic_metadata.type)
             except (AttributeError, ModuleNotFoundError, ValueError):
                 raise RuntimeError('The passed message type is invalid')
+            handler = make_handler(*self._topic_map[topic], msg_module)
+            if handler is not None:
+                self._handlers[topic] = handler
         return topic_metadata
 
     def filter_msg(self, msg):
         (topic, data, t) = msg
-        if topic in getattr(self, '_topic_map', {}):
-            if not self._msg_module:
-                raise RuntimeError(f"Could not load message type of topic '{topic}'")
-            msg = deserialize_message(data, self._msg_module)
-            mapping = self._topic_map[topic]
-            # Patch header.frame_id if specified
-            if 'frame_id' in mapping and hasattr(msg, 'header') and hasattr(msg.header, 'frame_id'):
-                old, new = mapping['frame_id']
-                if old == '*' or msg.header.frame_id == old:
-                    msg.header.frame_id = new
-            # Patch child_frame_id if specified
-            if 'child_frame_id' in mapping and hasattr(msg, 'child_frame_id'):
-                old, new = mapping['child_frame_id']
-                if old == '*' or msg.child_frame_id == old:
-                    msg.child_frame_id = new
-            return (topic, serialize_message(msg), t)
-        return msg
+        handler = self._handlers.get(topic)
+        if handler is None:
+            return msg
+        return handler(topic, data, t)
@@ -15,6 +15,9 @@
 import argparse
 from datetime import datetime
 import os
+import shutil
+import subprocess
+import threading
 
 from ros2bag.api import print_error
 from ros2bag.verb import VerbExtension
@@ -27,10 +30,28 @@ from rosbag2_py import ConverterOptions
 from rosbag2_py import get_registered_readers
 from rosbag2_py import get_registered_writers
 from rosbag2_py import Info
+from rosbag2_py import SequentialCompressionReader
+from rosbag2_py import SequentialReader
 from rosbag2_py import SequentialWriter
 from rosbag2_py import StorageOptions
 
 
+# serializes output of bags processed by parallel threads of one process, so lines are not torn
+_output_lock = threading.Lock()
+
+
+def print_locked(*args, **kwargs):
+    """Print like print, without interleaving with other threads using this function."""
+    with _output_lock:
+        print(*args, **kwargs)
+
+
+def print_error_locked(*args, **kwargs):
+    """Print like ros2bag.api.print_error, without interleaving with other threads."""
+    with _output_lock:
+        print_error(*args, **kwargs)
+
+
 def get_reader_options(args):
     """Get rosbag options from args matching the ros2bag.api.add_standard_reader_args names."""
     serialization_format = (
@@ -47,6 +68,78 @@ def get_reader_options(args):
     return storage_options, converter_options
 
 
+def copy_bag(bag_path, output_path):
+    """
+    Copy a bag without duplicating its data if possible.
+
+    Data files are hard-linked, so the copy shares their inodes with the input bag.
+    metadata.yaml is always copied, as tools may rewrite it in place.
+    If linking fails, e.g. across file systems, the files are copied with reflinks where
+    supported, and finally with a plain copy.
+    """
+    def link_data_file(src, dst):
+        if os.path.basename(src) == 'metadata.yaml':
+            return shutil.copy2(src, dst)
+        os.link(src, dst)
+        return dst
+
+    try:
+        shutil.copytree(bag_path, output_path, copy_function=link_data_file)
+        return
+    except OSError:
+        shutil.rmtree(output_path, ignore_errors=True)
+    try:
+        subprocess.run(
+            ['cp', '-r', '--reflink=auto', bag_path, output_path],
+            check=True,
+            capture_output=True,
+        )
+        return
+    except (OSError, subprocess.CalledProcessError):
+        shutil.rmtree(output_path, ignore_errors=True)
+    shutil.copytree(bag_path, output_path)
+
+
+def rewrite_bag(input_bag, storage_options, start_time_ns=None, end_time_ns=None):
+    """
+    Copy the messages of a bag into a new bag written with storage_options.
+
+    Compressed bags are read with the compression reader, the new bag is written without
+    compression. An empty storage id in storage_options is set to the one of the input bag.
+    Only messages received from start_time_ns to end_time_ns are copied, None leaves a bound
+    open. Returns the number of copied messages.
+    """
+    metadata = Info().read_metadata(input_bag, '')
+    # the plain reader cannot read file or message compressed bags
+    reader = SequentialCompressionReader() if metadata.compression_format else SequentialReader()
+    reader.open(
+        StorageOptions(uri=input_bag, storage_id=metadata.storage_identifier),
+        ConverterOptions('', ''),
+    )
+    if start_time_ns is not None:
+        reader.seek(start_time_ns)
+    if not storage_options.storage_id:
+        storage_options.storage_id = metadata.storage_identifier
+    writer = SequentialWriter()
+    writer.open(storage_options, ConverterOptions('', ''))
+    for topic in reader.get_all_topics_and_types():
+        writer.create_topic(topic)
+    has_next = reader.has_next
+    read_next = reader.read_next
+    write = writer.write
+    copied_messages = 0
+    while has_next():
+        topic, data, t = read_next()
+        if end_time_ns is not None and t > end_time_ns:
+            break
+        write(topic, data, t)
+        copied_messages += 1
+    # the writer finalizes the bag and its metadata.yaml when it is destroyed, the bound
+    # write method holds a reference to it as well
+    del write, writer
+    return copied_messages
+
+
 class FilterVerb(VerbExtension):
     """Abstract base class for bag message processing verbs."""
 
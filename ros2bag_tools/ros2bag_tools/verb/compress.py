@@ -17,10 +17,21 @@ import subprocess
 import tempfile
 import yaml
 import glob
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 from ros2bag.verb import VerbExtension
 from ros2bag.api import print_error
+from ros2bag_tools.verb import print_error_locked
+from ros2bag_tools.verb import print_locked
+
+from rosbag2_py import Info
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeDumper
+
 
 
 class CompressVerb(VerbExtension):
@@ -77,6 +88,13 @@ class CompressVerb(VerbExtension):
             action='store_true',
             help='Print the YAML configuration used for compression'
         )
+        parser.add_argument(
+            '-j', '--jobs',
+            type=int,
+            default=max(1, (os.cpu_count() or 1) // 4),
+            help='Number of bags to compress in parallel '
+                 '(default: a quarter of the CPU cores, as zstd is multi-threaded itself)'
+        )
 
     def main(self, *, args):
         # Expand glob patterns and validate inputs
@@ -112,39 +130,25 @@ class CompressVerb(VerbExtension):
             print_error("Cannot specify output name (-o) when compressing multiple bags")
             return 1
 
+        if args.jobs < 1:
+            print_error("Number of jobs must be at least 1")
+            return 1
+
         print(f"Found {len(input_bags)} valid bag(s) to compress")
-        
+
         success_count = 0
         total_count = len(input_bags)
-        
-        for input_bag in input_bags:
-            output_bag = args.output if args.output else f"{input_bag}_compressed"
-            
-            # Get original bag info if validation is requested
-            original_info = None
-            original_messages = None
-            if args.validate:
-                try:
-                    result = subprocess.run(
-                        ['ros2', 'bag', 'info', input_bag],
-                        capture_output=True,
-                        text=True,
-                        check=True
-                    )
-                    original_info = result.stdout
-                    # Extract message count
-                    for line in original_info.split('\n'):
-                        if 'Messages:' in line:
-                            original_messages = int(line.split(':')[1].strip())
-                            break
-                except (subprocess.CalledProcessError, ValueError):
-                    print(f"Warning: Could not get original message count for {input_bag}")
-
-            # Compress the bag
-            if self._compress_single_bag(input_bag, output_bag, args, original_info, original_messages):
-                success_count += 1
-            else:
-                print_error(f"Failed to compress: {input_bag}")
+
+        with ThreadPoolExecutor(max_workers=min(args.jobs, total_count)) as executor:
+            futures = {
+                executor.submit(self._compress_one, input_bag, args): input_bag
+                for input_bag in input_bags
+            }
+            for future in as_completed(futures):
+                if future.result():
+                    success_count += 1
+                else:
+                    print_error_locked(f"Failed to compress: {futures[future]}")
 
         # Summary
         if total_count > 1:
@@ -152,56 +156,86 @@ class CompressVerb(VerbExtension):
         
         return 0 if success_count == total_count else 1
 
+    def _compress_one(self, input_bag, args):
+        """Validate and compress a single input bag, return True on success."""
+        output_bag = args.output if args.output else f"{input_bag}_compressed"
+
+        # Get original bag info if validation is requested
+        original_messages = None
+        original_size = None
+        if args.validate:
+            try:
+                original_messages, original_size = self._read_bag_stats(input_bag)
+            except RuntimeError:
+                print_locked(f"Warning: Could not get original message count for {input_bag}")
+
+        return self._compress_single_bag(
+            input_bag, output_bag, args, original_messages, original_size)
+
+    def _read_bag_stats(self, bag_path):
+        """Return message count and size in bytes of a bag, read from its metadata."""
+        metadata = Info().read_metadata(bag_path, '')
+        return metadata.message_count, metadata.bag_size
+
     def _is_valid_bag(self, bag_path):
         """Check if a directory is a valid ROS2 bag."""
-        if not os.path.isdir(bag_path):
-            return False
-            
-        # Check for metadata.yaml
-        metadata_path = os.path.join(bag_path, 'metadata.yaml')
-        if not os.path.exists(metadata_path):
-            return False
-            
-        # Check for at least one data file (mcap or db3)
-        data_files = glob.glob(os.path.join(bag_path, '*.mcap')) + \
-                    glob.glob(os.path.join(bag_path, '*.db3'))
-        return len(data_files) > 0
+        # A bag needs metadata.yaml and at least one data file (mcap or db3),
+        # check both in a single pass over the directory
+        has_metadata = False
+        has_data = False
+        try:
+            with os.scandir(bag_path) as entries:
+                for entry in entries:
+                    if entry.name == 'metadata.yaml':
+                        has_metadata = entry.is_file()
+                    elif entry.name.endswith(('.mcap', '.db3')) and entry.is_file():
+                        has_data = True
+                    if has_metadata and has_data:
+                        return True
+        except OSError:
+            # missing, not a directory or not readable
+            pass
+        return False
 
-    def _compress_single_bag(self, input_bag, output_bag, args, original_info=None, original_messages=None):
+    def _compress_single_bag(self, input_bag, output_bag, args, original_messages=None,
+                             original_size=None):
         """Compress a single bag file."""
-        # Create temporary YAML configuration
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as temp_file:
-            config = {
-                'output_bags': [{
-                    'uri': output_bag,
-                    'max_bagfile_size': args.max_size,
-                    'all_topics': True,
-                    'compression_mode': args.compression_mode,
-                    'compression_format': args.compression_format
-                }]
-            }
-            
-            # Add compression_queue_size only for message mode
-            if args.compression_mode == 'message':
-                config['output_bags'][0]['compression_queue_size'] = args.queue_size
-                
-            yaml.dump(config, temp_file, default_flow_style=False)
-            temp_yaml_path = temp_file.name
+        config = {
+            'output_bags': [{
+                'uri': output_bag,
+                'max_bagfile_size': args.max_size,
+                'all_topics': True,
+                'compression_mode': args.compression_mode,
+                'compression_format': args.compression_format
+            }]
+        }
+
+        # Add compression_queue_size only for message mode
+        if args.compression_mode == 'message':
+            config['output_bags'][0]['compression_queue_size'] = args.queue_size
+
+        config_text = yaml.dump(config, Dumper=SafeDumper, default_flow_style=False)
 
         # Print YAML configuration if verbose mode is enabled
         if args.verbose:
-            print(f"\nYAML Configuration for {input_bag}:")
-            print("=" * 50)
-            print(yaml.dump(config, default_flow_style=False))
-            print("=" * 50)
+            # single print, so parallel jobs do not interleave the block
+            print_locked(f"\nYAML Configuration for {input_bag}:\n{'=' * 50}\n"
+                   f"{config_text}\n{'=' * 50}")
 
+        temp_yaml_path = None
         try:
+            # Create temporary YAML configuration, inside the try so it is always removed
+            temp_fd, temp_yaml_path = tempfile.mkstemp(suffix='.yaml')
+            with os.fdopen(temp_fd, 'w') as temp_file:
+                temp_file.write(config_text)
+
             # Display compression info
             queue_info = f", queue={args.queue_size}" if args.compression_mode == 'message' else ""
-            print(f"Compressing: {input_bag} -> {output_bag} "
+            print_locked(f"Compressing: {input_bag} -> {output_bag} "
                   f"({args.compression_mode}/{args.compression_format}{queue_info})")
 
-            # Run ros2 bag convert
+            # Run ros2 bag convert, once per input bag: convert merges all of its inputs into
+            # every output bag, so several bags cannot be compressed by a single invocation
             result = subprocess.run(
                 ['ros2', 'bag', 'convert', '-i', input_bag, '-o', temp_yaml_path],
                 capture_output=True,
@@ -209,13 +243,13 @@ class CompressVerb(VerbExtension):
             )
             
             if result.returncode != 0:
-                print_error(f"Compression failed for {input_bag}!")
-                print_error(result.stderr)
+                print_error_locked(f"Compression failed for {input_bag}!")
+                print_error_locked(result.stderr)
                 return False
 
             # Validate output exists
             if not (os.path.exists(output_bag) and (os.path.isdir(output_bag) or os.path.isfile(output_bag))):
-                print_error(f"Output bag not found after compression: {output_bag}")
+                print_error_locked(f"Output bag not found after compression: {output_bag}")
                 return False
 
             # Check if the output bag has valid metadata
@@ -225,98 +259,50 @@ class CompressVerb(VerbExtension):
                     with open(metadata_path, 'r') as f:
                         content = f.read().strip()
                         if not content:
-                            print_error(f"Output bag has empty metadata.yaml - compression may have failed: {output_bag}")
-                            print("💡 Try using file compression mode (-m file) or adjusting queue size")
+                            print_error_locked(f"Output bag has empty metadata.yaml - compression may have failed: {output_bag}")
+                            print_locked("💡 Try using file compression mode (-m file) or adjusting queue size")
                             return False
                 except Exception as e:
-                    print_error(f"Could not read metadata.yaml for {output_bag}: {e}")
+                    print_error_locked(f"Could not read metadata.yaml for {output_bag}: {e}")
                     return False
 
             # Validate message count if requested
             if args.validate and original_messages is not None:
                 try:
-                    result = subprocess.run(
-                        ['ros2', 'bag', 'info', output_bag],
-                        capture_output=True,
-                        text=True,
-                        check=False  # Don't raise exception, handle error manually
-                    )
-                    
-                    if result.returncode != 0:
-                        print_error(f"Output bag appears to be corrupted - cannot read bag info: {output_bag}")
-                        print_error(result.stderr)
-                        print("💡 Try using file compression mode (-m file) or adjusting queue size")
-                        return False
-                        
-                    compressed_info = result.stdout
-                    compressed_messages = None
-                    
-                    # Extract message count
-                    for line in compressed_info.split('\n'):
-                        if 'Messages:' in line:
-                            compressed_messages = int(line.split(':')[1].strip())
-                            break
-                    
-                    if compressed_messages is not None:
-                        if original_messages == compressed_messages:
-                            # Try to calculate compression ratio
-                            try:
-                                original_size = self._extract_bag_size(original_info)
-                                compressed_size = self._extract_bag_size(compressed_info)
-                                
-                                if original_size and compressed_size:
-                                    ratio = (compressed_size / original_size) * 100
-                                    original_size_str = self._format_size(original_size)
-                                    compressed_size_str = self._format_size(compressed_size)
-                                    print(f"✅ Success: {original_messages} messages preserved | "
-                                          f"{original_size_str} -> {compressed_size_str} ({ratio:.1f}%)")
-                                else:
-                                    print(f"✅ Success: {original_messages} messages preserved")
-                            except:
-                                print(f"✅ Success: {original_messages} messages preserved")
-                        else:
-                            print_error(f"Message count mismatch! Original: {original_messages}, "
-                                      f"Compressed: {compressed_messages}")
-                            print("💡 Try increasing compression_queue_size or using file compression mode")
-                            return False
+                    compressed_messages, compressed_size = self._read_bag_stats(output_bag)
+                except RuntimeError as e:
+                    print_error_locked(f"Output bag appears to be corrupted - cannot read bag info: {output_bag}")
+                    print_error_locked(str(e))
+                    print_locked("💡 Try using file compression mode (-m file) or adjusting queue size")
+                    return False
+
+                if original_messages == compressed_messages:
+                    # Calculate compression ratio
+                    if original_size and compressed_size:
+                        ratio = (compressed_size / original_size) * 100
+                        original_size_str = self._format_size(original_size)
+                        compressed_size_str = self._format_size(compressed_size)
+                        print_locked(f"✅ Success: {original_messages} messages preserved | "
+                               f"{original_size_str} -> {compressed_size_str} ({ratio:.1f}%)")
                     else:
-                        print(f"✅ Compression completed (could not validate message count)")
-                        
-                except subprocess.CalledProcessError:
-                    print(f"✅ Compression completed (could not validate message count)")
+                        print_locked(f"✅ Success: {original_messages} messages preserved")
+                else:
+                    print_error_locked(f"Message count mismatch! Original: {original_messages}, "
+                                 f"Compressed: {compressed_messages}")
+                    print_locked("💡 Try increasing compression_queue_size or using file compression mode")
+                    return False
             else:
-                print(f"✅ Compression completed")
+                print_locked(f"✅ Compression completed")
 
             return True
 
         finally:
             # Clean up temporary file
-            try:
-                os.unlink(temp_yaml_path)
-            except OSError:
-                pass
-
-    def _extract_bag_size(self, bag_info):
-        """Extract bag size in bytes from ros2 bag info output."""
-        try:
-            for line in bag_info.split('\n'):
-                if 'Bag size:' in line:
-                    parts = line.split()
-                    if len(parts) >= 4:
-                        size_value = float(parts[2])
-                        unit = parts[3]
-                        
-                        if unit == 'GiB':
-                            return int(size_value * 1024 * 1024 * 1024)
-                        elif unit == 'MiB':
-                            return int(size_value * 1024 * 1024)
-                        elif unit == 'KiB':
-                            return int(size_value * 1024)
-                        else:  # bytes
-                            return int(size_value)
-        except (ValueError, IndexError):
-            pass
-        return None
+            if temp_yaml_path is not None:
+                try:
+                    os.unlink(temp_yaml_path)
+                except OSError:
+                    pass
 
     def _format_size(self, size_bytes):
         """Format size in bytes to human readable format."""
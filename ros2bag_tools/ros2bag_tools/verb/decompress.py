@@ -1,13 +1,37 @@
 import os
+import re
 import subprocess
-import tempfile
 import yaml
 import glob
+from argparse import Namespace
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 
 from ros2bag.verb import VerbExtension
 from ros2bag.api import print_error
 
+from ros2bag_tools.verb import print_error_locked
+from ros2bag_tools.verb import print_locked
+from ros2bag_tools.verb import rewrite_bag
+
+from rosbag2_py import StorageOptions
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+
+# bytes per unit as printed by ros2 bag info
+_UNIT_BYTES = {'GiB': 1 << 30, 'MiB': 1 << 20, 'KiB': 1 << 10, 'B': 1}
+# units used for printing sizes, largest first
+_SIZE_STEPS = ((1 << 30, 'GiB'), (1 << 20, 'MiB'), (1 << 10, 'KiB'))
+
+# fields of the ros2 bag info output
+_MSGS_RE = re.compile(r'^\s*Messages:\s*(\d+)', re.M)
+_SIZE_RE = re.compile(r'^\s*Bag size:\s*([\d.]+)\s+(\w+)', re.M)
+
 
 class DecompressVerb(VerbExtension):
     """Decompress ROS2 bags by re-writing them without compression."""
@@ -44,7 +68,13 @@ class DecompressVerb(VerbExtension):
         parser.add_argument(
             '-v', '--verbose',
             action='store_true',
-            help='Print the YAML configuration used for decompression'
+            help='Print the storage options the output bags are written with'
+        )
+        parser.add_argument(
+            '-j', '--jobs',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of bags to decompress in parallel (default: number of CPU cores)'
         )
 
     def main(self, *, args):
@@ -75,127 +105,144 @@ class DecompressVerb(VerbExtension):
             print_error('Cannot specify output name (-o) when processing multiple bags')
             return 1
 
+        if args.jobs < 1:
+            print_error('Number of jobs must be at least 1')
+            return 1
+
         print(f"Found {len(input_bags)} valid bag(s) to decompress")
         success = 0
-        for input_bag in input_bags:
-            output_bag = args.output if args.output else f"{input_bag}_decompressed"
-            if self._decompress_single_bag(input_bag, output_bag, args):
-                success += 1
-            else:
-                print_error(f"Failed to decompress: {input_bag}")
+        # the copy loop holds the GIL, so parallel bags are decompressed in separate processes
+        jobs = min(args.jobs, len(input_bags))
+        executor_type = ProcessPoolExecutor if jobs > 1 else ThreadPoolExecutor
+        # only plain options are sent to the workers, the parsed args are not picklable
+        options = Namespace(max_size=args.max_size, validate=args.validate, verbose=args.verbose)
+        with executor_type(max_workers=jobs) as executor:
+            futures = {}
+            for input_bag in input_bags:
+                output_bag = args.output if args.output else f"{input_bag}_decompressed"
+                future = executor.submit(_decompress_bag, input_bag, output_bag, options)
+                futures[future] = input_bag
+            for future in as_completed(futures):
+                try:
+                    decompressed = future.result()
+                except BrokenProcessPool as e:
+                    # a crashed worker, e.g. in native rosbag2 code, fails its pending bags
+                    print_error_locked(f"Decompression worker of {futures[future]} died: {e}")
+                    decompressed = False
+                if decompressed:
+                    success += 1
+                else:
+                    print_error_locked(f"Failed to decompress: {futures[future]}")
 
         if len(input_bags) > 1:
             print(f"\nDecompression summary: {success}/{len(input_bags)} succeeded")
         return 0 if success == len(input_bags) else 1
 
     def _is_valid_bag(self, bag_path):
-        if not os.path.isdir(bag_path):
-            return False
-        if not os.path.exists(os.path.join(bag_path, 'metadata.yaml')):
-            return False
-        data_files = glob.glob(os.path.join(bag_path, '*.mcap')) + glob.glob(os.path.join(bag_path, '*.db3'))
-        return len(data_files) > 0
+        # metadata.yaml and at least one data file, checked in a single directory scan
+        has_metadata = False
+        has_data = False
+        try:
+            with os.scandir(bag_path) as entries:
+                for entry in entries:
+                    if entry.name == 'metadata.yaml':
+                        has_metadata = entry.is_file()
+                    elif entry.name.endswith(('.mcap', '.db3')) and entry.is_file():
+                        has_data = True
+                    if has_metadata and has_data:
+                        return True
+        except OSError:
+            pass
+        return False
+
+    def _read_bag_stats(self, bag_path):
+        """Return message count and size in bytes of a bag, read from its metadata.yaml."""
+        metadata_path = os.path.join(bag_path, 'metadata.yaml')
+        if not os.path.exists(metadata_path):
+            return self._read_bag_stats_from_info(bag_path)
+        with open(metadata_path, 'r') as f:
+            info = yaml.load(f, Loader=SafeLoader)['rosbag2_bagfile_information']
+        size = sum(os.path.getsize(os.path.join(bag_path, path))
+                   for path in info['relative_file_paths'])
+        return info['message_count'], size
+
+    def _read_bag_stats_from_info(self, bag_path):
+        """Get message count and size in bytes from ros2 bag info, values may be None."""
+        res = subprocess.run(['ros2', 'bag', 'info', bag_path], capture_output=True, text=True, check=True)
+        match = _MSGS_RE.search(res.stdout)
+        messages = int(match.group(1)) if match else None
+        return messages, self._extract_bag_size(res.stdout)
 
     def _decompress_single_bag(self, input_bag, output_bag, args):
-        original_info = None
         original_messages = None
+        original_size = None
         try:
             if args.validate:
-                res = subprocess.run(['ros2', 'bag', 'info', input_bag], capture_output=True, text=True, check=True)
-                original_info = res.stdout
-                for line in original_info.splitlines():
-                    if 'Messages:' in line:
-                        original_messages = int(line.split(':', 1)[1].strip())
-                        break
+                original_messages, original_size = self._read_bag_stats(input_bag)
         except Exception:
-            print('Warning: could not read original message count')
-
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as tmp:
-            cfg = {
-                'output_bags': [{
-                    'uri': output_bag,
-                    'max_bagfile_size': args.max_size,
-                    'all_topics': True
-                }]
-            }
-            yaml.dump(cfg, tmp, default_flow_style=False)
-            cfg_path = tmp.name
-
-        if args.verbose:
-            print(f"\nYAML Configuration for {input_bag}:")
-            print('=' * 50)
-            print(yaml.dump(cfg, default_flow_style=False))
-            print('=' * 50)
-
-        print(f"Decompressing: {input_bag} -> {output_bag}")
+            print_locked('Warning: could not read original message count')
+
+        print_locked(f"Decompressing: {input_bag} -> {output_bag}")
         try:
-            run = subprocess.run(['ros2', 'bag', 'convert', '-i', input_bag, '-o', cfg_path], capture_output=True, text=True)
-            if run.returncode != 0:
-                print_error('ros2 bag convert failed')
-                print_error(run.stderr)
-                return False
+            self._decompress_inline(input_bag, output_bag, args.max_size, args.verbose)
+        except Exception as e:
+            print_error_locked(f"Decompression of {input_bag} failed: {e}")
+            return False
 
-            if not os.path.isdir(output_bag):
-                print_error('Output bag not created')
-                return False
+        if not os.path.isdir(output_bag):
+            print_error_locked('Output bag not created')
+            return False
 
-            # Validate message count
-            if args.validate and original_messages is not None:
-                out_info = subprocess.run(['ros2', 'bag', 'info', output_bag], capture_output=True, text=True)
-                if out_info.returncode != 0:
-                    print_error('Failed to inspect output bag')
-                    return False
-                compressed_messages = None
-                for line in out_info.stdout.splitlines():
-                    if 'Messages:' in line:
-                        compressed_messages = int(line.split(':', 1)[1].strip())
-                        break
-                if compressed_messages is not None and compressed_messages != original_messages:
-                    print_error(f"Message count mismatch: {original_messages} vs {compressed_messages}")
-                    return False
-                size_before = self._extract_bag_size(original_info)
-                size_after = self._extract_bag_size(out_info.stdout)
-                if size_before and size_after:
-                    if size_after > 0:
-                        expansion = (size_after / size_before) * 100
-                        print(f"✅ Success: {original_messages} messages | size {self._format_size(size_before)} -> {self._format_size(size_after)} ({expansion:.1f}% of original)")
-                    else:
-                        print(f"✅ Success: {original_messages} messages | size {self._format_size(size_before)} -> {self._format_size(size_after)}")
+        # Validate message count
+        if args.validate and original_messages is not None:
+            try:
+                compressed_messages, size_after = self._read_bag_stats(output_bag)
+            except Exception:
+                print_error_locked('Failed to inspect output bag')
+                return False
+            if compressed_messages is not None and compressed_messages != original_messages:
+                print_error_locked(f"Message count mismatch: {original_messages} vs {compressed_messages}")
+                return False
+            size_before = original_size
+            if size_before and size_after:
+                if size_after > 0:
+                    expansion = (size_after / size_before) * 100
+                    print_locked(f"✅ Success: {original_messages} messages | size {self._format_size(size_before)} -> {self._format_size(size_after)} ({expansion:.1f}% of original)")
                 else:
-                    print(f"✅ Success: {original_messages} messages preserved")
+                    print_locked(f"✅ Success: {original_messages} messages | size {self._format_size(size_before)} -> {self._format_size(size_after)}")
             else:
-                print('✅ Decompression completed')
-            return True
-        finally:
-            try:
-                os.unlink(cfg_path)
-            except OSError:
-                pass
+                print_locked(f"✅ Success: {original_messages} messages preserved")
+        else:
+            print_locked('✅ Decompression completed')
+        return True
+
+    def _decompress_inline(self, input_bag, output_bag, max_size, verbose=False):
+        """Copy all messages of a bag into a new bag without compression."""
+        storage_options = StorageOptions(uri=output_bag, max_bagfile_size=max_size)
+        if verbose:
+            # single print, so parallel jobs do not interleave the block
+            print_locked(f"\nStorage options for {input_bag}:\n{'=' * 50}\n"
+                   f"uri: {storage_options.uri}\n"
+                   f"storage_id: same as input bag\n"
+                   f"max_bagfile_size: {storage_options.max_bagfile_size}\n{'=' * 50}")
+        rewrite_bag(input_bag, storage_options)
 
     def _extract_bag_size(self, bag_info):
+        match = _SIZE_RE.search(bag_info)
+        if match is None:
+            return None
         try:
-            for line in bag_info.splitlines():
-                if 'Bag size:' in line:
-                    parts = line.split()
-                    if len(parts) >= 4:
-                        val = float(parts[2])
-                        unit = parts[3]
-                        if unit == 'GiB':
-                            return int(val * 1024 ** 3)
-                        if unit == 'MiB':
-                            return int(val * 1024 ** 2)
-                        if unit == 'KiB':
-                            return int(val * 1024)
-                        return int(val)
-        except Exception:
+            return int(float(match.group(1)) * _UNIT_BYTES.get(match.group(2), 1))
+        except ValueError:
             return None
-        return None
 
     def _format_size(self, size_bytes):
-        if size_bytes >= 1024 ** 3:
-            return f"{size_bytes / (1024 ** 3):.1f} GiB"
-        if size_bytes >= 1024 ** 2:
-            return f"{size_bytes / (1024 ** 2):.1f} MiB"
-        if size_bytes >= 1024:
-            return f"{size_bytes / 1024:.1f} KiB"
+        for unit_bytes, unit in _SIZE_STEPS:
+            if size_bytes >= unit_bytes:
+                return f"{size_bytes / unit_bytes:.1f} {unit}"
         return f"{size_bytes} bytes"
+
+
+def _decompress_bag(input_bag, output_bag, options):
+    """Decompress one bag, runs in a worker process when decompressing in parallel."""
+    return DecompressVerb()._decompress_single_bag(input_bag, output_bag, options)
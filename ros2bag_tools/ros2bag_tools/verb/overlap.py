@@ -12,14 +12,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import math
 import os
 import shutil
+import sqlite3
 import yaml
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Tuple
+from pathlib import Path
+from typing import List, Optional, Tuple
 
 from ros2bag.verb import VerbExtension
 from ros2bag.api import print_error
+from ros2bag_tools.verb import copy_bag
 
 from rosbag2_py import (
     SequentialReader,
@@ -28,6 +34,31 @@ from rosbag2_py import (
     ConverterOptions,
 )
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# bags are only opened to read their metadata, no conversion takes place
+CDR_CONVERTER_OPTIONS = ConverterOptions(
+    input_serialization_format="cdr",
+    output_serialization_format="cdr",
+)
+# (metadata path, mtime, size) -> (start, end), so unchanged metadata is parsed only once
+_timestamp_cache = {}
+
+# minimum, target and maximum number of major ticks of the time range plot
+TICK_MIN, TICK_TARGET, TICK_MAX = 4, 8, 10
+# matplotlib.dates locator, its interval argument, seconds per unit, tick label format
+TICK_UNITS = (
+    ("YearLocator", "base", 365 * 86400, '%Y'),
+    ("MonthLocator", "interval", 30 * 86400, '%Y-%m'),
+    ("DayLocator", "interval", 86400, '%m-%d'),
+    ("HourLocator", "interval", 3600, '%m-%d %H:%M'),
+    ("MinuteLocator", "interval", 60, '%H:%M'),
+    ("SecondLocator", "interval", 1, '%H:%M:%S'),
+)
+
 
 class OverlapVerb(VerbExtension):
     """Find temporal overlap between ROS bag files and optionally crop them."""
@@ -41,7 +72,8 @@ class OverlapVerb(VerbExtension):
         parser.add_argument(
             '--crop',
             action='store_true',
-            help='Crop bags to overlap period'
+            help='Crop bags to overlap period. Data files of bags completely within the overlap '
+                 'are hard-linked into the output if possible, sharing their inodes with the input'
         )
         parser.add_argument(
             '--output-dir',
@@ -78,21 +110,13 @@ class OverlapVerb(VerbExtension):
             print_error("No valid bag files found in the specified paths.")
             return 1
 
-        time_ranges = []
-        for bag_path in bag_files:
-            try:
-                start, end = self._get_start_end_timestamps(bag_path)
-                time_ranges.append((start, end, bag_path))
-            except Exception as e:
-                print_error(f"Error processing {bag_path}: {e}")
-                continue
+        time_ranges = self._get_time_ranges(bag_files)
 
         if not time_ranges:
             print_error("No valid bag files could be processed.")
             return 1
 
-        overlap_start = max(start for start, _, _ in time_ranges)
-        overlap_end = min(end for _, end, _ in time_ranges)
+        overlap_start, overlap_end = self._compute_overlap(time_ranges)
 
         if overlap_start > overlap_end:
             print("Warning: No temporal overlap found between the bag files.")
@@ -129,21 +153,13 @@ class OverlapVerb(VerbExtension):
         overwrite = args.overwrite
 
         # Find overlap
-        time_ranges = []
-        for bag_path in bag_files:
-            try:
-                start, end = self._get_start_end_timestamps(bag_path)
-                time_ranges.append((start, end, bag_path))
-            except Exception as e:
-                print_error(f"Error processing {bag_path}: {e}")
-                continue
+        time_ranges = self._get_time_ranges(bag_files)
 
         if not time_ranges:
             print_error("No valid bag files could be processed.")
             return 1
 
-        overlap_start = max(start for start, _, _ in time_ranges)
-        overlap_end = min(end for _, end, _ in time_ranges)
+        overlap_start, overlap_end = self._compute_overlap(time_ranges)
 
         # Check if there's a valid overlap
         if overlap_start >= overlap_end:
@@ -164,7 +180,61 @@ class OverlapVerb(VerbExtension):
         print(f"\nSuccessfully cropped {success_count}/{len(bag_files)} bags")
         return 0 if success_count > 0 else 1
 
+    def _get_time_ranges(self, bag_files: List[str]) -> List[Tuple[datetime, datetime, str]]:
+        """Get the time ranges of all bags in parallel, skipping bags that cannot be read."""
+        def get_timestamps(bag_path):
+            try:
+                return self._get_start_end_timestamps(bag_path)
+            except Exception as e:
+                return e
+
+        # reading metadata is I/O bound, so threads overlap the file accesses of the bags
+        with ThreadPoolExecutor(max_workers=min(32, len(bag_files))) as executor:
+            results = list(executor.map(get_timestamps, bag_files))
+
+        time_ranges = []
+        for bag_path, result in zip(bag_files, results):
+            if isinstance(result, Exception):
+                print_error(f"Error processing {bag_path}: {result}")
+                continue
+            start, end = result
+            time_ranges.append((start, end, bag_path))
+        return time_ranges
+
+    def _compute_overlap(self, time_ranges) -> Tuple[datetime, datetime]:
+        """Return the latest start and earliest end of the time ranges in a single pass."""
+        overlap_start = datetime.min
+        overlap_end = datetime.max
+        for start, end, _ in time_ranges:
+            if start > overlap_start:
+                overlap_start = start
+            if end < overlap_end:
+                overlap_end = end
+        return overlap_start, overlap_end
+
     def _get_start_end_timestamps(self, bag_path: str) -> Tuple[datetime, datetime]:
+        """Get the start and end timestamps of a bag file, cached until its metadata changes."""
+        key = self._timestamp_cache_key(bag_path)
+        timestamps = _timestamp_cache.get(key) if key is not None else None
+        if timestamps is None:
+            timestamps = self._read_start_end_timestamps(bag_path)
+            if key is not None:
+                _timestamp_cache[key] = timestamps
+        return timestamps
+
+    def _timestamp_cache_key(self, bag_path: str) -> Optional[Tuple[str, int, int]]:
+        """Identify the metadata of a bag by path, modification time and size."""
+        bag_dir = bag_path if os.path.isdir(bag_path) else os.path.dirname(bag_path)
+        # bags without metadata.yaml are read directly, so the bag itself identifies them
+        for path in (os.path.join(bag_dir, "metadata.yaml"), bag_path):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            return path, st.st_mtime_ns, st.st_size
+        return None
+
+    def _read_start_end_timestamps(self, bag_path: str) -> Tuple[datetime, datetime]:
         """Get the start and end timestamps of a bag file by parsing metadata.yaml."""
         
         # Determine if bag_path is a directory or file
@@ -183,7 +253,7 @@ class OverlapVerb(VerbExtension):
         # Parse metadata.yaml
         try:
             with open(metadata_path, 'r') as f:
-                metadata = yaml.safe_load(f)
+                metadata = yaml.load(f, Loader=SafeLoader)
             
             # Check if metadata is None or empty
             if metadata is None:
@@ -232,21 +302,16 @@ class OverlapVerb(VerbExtension):
         # Process file(s) to find start and end times
         start_ns = float("inf")
         end_ns = float("-inf")
-        
+        # a single reader is reopened for every file that has to be read with rosbag2
+        reader = None
+
         for file_path in file_paths:
-            storage_options = StorageOptions(uri=file_path, storage_id=storage_id)
-            converter_options = ConverterOptions(
-                input_serialization_format="cdr",
-                output_serialization_format="cdr",
-            )
-            
-            reader = SequentialReader()
-            reader.open(storage_options, converter_options)
-            metadata = reader.get_metadata()
-            
-            file_start = metadata.starting_time.nanoseconds
-            file_end = file_start + metadata.duration.nanoseconds
-            
+            time_range = self._get_file_time_range(file_path, storage_id)
+            if time_range is None:
+                if reader is None:
+                    reader = SequentialReader()
+                time_range = self._get_file_time_range_using_reader(reader, file_path, storage_id)
+            file_start, file_end = time_range
             start_ns = min(start_ns, file_start)
             end_ns = max(end_ns, file_end)
         
@@ -256,38 +321,92 @@ class OverlapVerb(VerbExtension):
         
         return start_dt, end_dt
 
-    def _get_all_bag_files(self, paths: List[str]) -> List[str]:
-        """Recursively process the input paths and return a list of all bag files/directories."""
+    def _get_file_time_range(self, file_path: str, storage_id: str) -> Optional[Tuple[int, int]]:
+        """Get first and last message time of a storage file in nanoseconds, None if unknown."""
+        try:
+            if storage_id == "mcap":
+                return self._get_mcap_time_range(file_path)
+            return self._get_sqlite_time_range(file_path)
+        except Exception as e:
+            print(f"Warning: Could not read {file_path} directly: {e}. Using SequentialReader.")
+            return None
+
+    def _get_file_time_range_using_reader(
+        self, reader: SequentialReader, file_path: str, storage_id: str
+    ) -> Tuple[int, int]:
+        """Get first and last message time of a storage file in nanoseconds using rosbag2."""
+        storage_options = StorageOptions(uri=file_path, storage_id=storage_id)
+        reader.open(storage_options, CDR_CONVERTER_OPTIONS)
+        metadata = reader.get_metadata()
+
+        file_start = metadata.starting_time.nanoseconds
+        return file_start, file_start + metadata.duration.nanoseconds
+
+    def _get_mcap_time_range(self, file_path: str) -> Optional[Tuple[int, int]]:
+        """Read the message time range from the summary section of a MCAP file."""
+        try:
+            from mcap.reader import make_reader
+        except ImportError:
+            return None
+        with open(file_path, "rb") as f:
+            summary = make_reader(f).get_summary()
+        if summary is None or summary.statistics is None:
+            return None
+        statistics = summary.statistics
+        return statistics.message_start_time, statistics.message_end_time
+
+    def _get_sqlite_time_range(self, file_path: str) -> Optional[Tuple[int, int]]:
+        """Query the message time range of a rosbag2 sqlite3 file."""
+        uri = Path(file_path).resolve().as_uri() + "?mode=ro"
+        connection = sqlite3.connect(uri, uri=True)
+        try:
+            start, end = connection.execute(
+                "SELECT MIN(timestamp), MAX(timestamp) FROM messages"
+            ).fetchone()
+        finally:
+            connection.close()
+        if start is None:
+            return None
+        return start, end
+
+    def _get_all_bag_files(self, paths: List[str], max_depth: int = 1) -> List[str]:
+        """Process the input paths and return a list of all bag files/directories."""
         bag_files = []
 
-        def is_bag_directory(dir_path):
-            """Check if a directory is a valid bag directory."""
-            if not os.path.isdir(dir_path):
-                return False
-            has_metadata = os.path.exists(os.path.join(dir_path, "metadata.yaml"))
-            files = os.listdir(dir_path)
-            has_db3 = any(f.endswith(".db3") for f in files)
-            has_mcap = any(f.endswith(".mcap") for f in files)
-            return has_metadata and (has_db3 or has_mcap)
-
-        def find_bag_files_recursively(path, n):
-            """Recursively find bag directories up to a specified depth."""
-            if n < 0:
-                return
-            if is_bag_directory(path):
-                bag_files.append(path)
-            else:
-                if os.path.isdir(path):
-                    for item in os.listdir(path):
-                        item_path = os.path.join(path, item)
-                        if not os.path.isdir(item_path):
-                            continue
-                        find_bag_files_recursively(item_path, n - 1)
+        def scan_directory(dir_path, list_subdirs):
+            """Scan a directory once, return whether it is a bag and its subdirectories."""
+            has_metadata = False
+            has_data = False
+            subdirs = []
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    if entry.name == "metadata.yaml":
+                        has_metadata = True
+                    elif entry.name.endswith((".db3", ".mcap")):
+                        has_data = True
+                    elif list_subdirs and entry.is_dir():
+                        subdirs.append(entry.path)
+            return has_metadata and has_data, subdirs
 
         for path in paths:
-            if not os.path.exists(path):
-                raise ValueError(f"Path {path} does not exist.")
-            find_bag_files_recursively(path, n=1)
+            # breadth-first search for bag directories up to max_depth below path
+            queue = deque([(path, 0)])
+            while queue:
+                dir_path, depth = queue.popleft()
+                try:
+                    is_bag, subdirs = scan_directory(dir_path, depth < max_depth)
+                except FileNotFoundError:
+                    if dir_path == path:
+                        raise ValueError(f"Path {path} does not exist.")
+                    continue
+                except OSError:
+                    # not a directory or not readable
+                    continue
+                if is_bag:
+                    # bags are not searched for nested bags
+                    bag_files.append(dir_path)
+                else:
+                    queue.extend((subdir, depth + 1) for subdir in subdirs)
 
         print(f"Found {len(bag_files)} bag files/directories:")
         for bag in bag_files:
@@ -343,7 +462,7 @@ class OverlapVerb(VerbExtension):
             # copy the entire bag
             print(f"Bag {bag_path} is completely contained in the overlap period.")
             print(f"Copying {bag_path} to {output_path}")
-            shutil.copytree(bag_path, output_path)
+            copy_bag(bag_path, output_path)
             return True
 
         # Create writer with max file size of 1GB
@@ -353,6 +472,8 @@ class OverlapVerb(VerbExtension):
                 uri=output_path,
                 storage_id=storage_id,
                 max_bagfile_size=1024 * 1024 * 1024,  # 1GB in bytes
+                # buffer messages and write them in batches instead of one at a time
+                max_cache_size=16 * 1024 * 1024,
             ),
             ConverterOptions("", ""),
         )
@@ -372,16 +493,32 @@ class OverlapVerb(VerbExtension):
         for topic in reader.get_all_topics_and_types():
             writer.create_topic(topic)
 
+        # Overlap bounds in nanoseconds, to compare against the message timestamps directly
+        start_ns = math.ceil(overlap_start.timestamp() * 1e9)
+        end_ns = math.floor(overlap_end.timestamp() * 1e9)
+
+        # Let the storage skip messages before the overlap instead of reading them
+        reader.seek(start_ns)
+
         # Copy messages within overlap period
         copied_msg_count = 0
         skipped_msg_count = 0
-        while reader.has_next():
-            (topic, data, t) = reader.read_next()
+        next_progress_count = 1000
+        # bound methods, so the loop does not look them up for every message
+        has_next = reader.has_next
+        read_next = reader.read_next
+        write = writer.write
+        while has_next():
+            (topic, data, t) = read_next()
             # t is already in nanoseconds
-            if overlap_start.timestamp() * 1e9 <= t <= overlap_end.timestamp() * 1e9:
-                writer.write(topic, data, t)
+            if t > end_ns:
+                # messages are read in timestamp order, the rest is after the overlap
+                break
+            if start_ns <= t:
+                write(topic, data, t)
                 copied_msg_count += 1
-                if copied_msg_count % 1000 == 0:
+                if copied_msg_count == next_progress_count:
+                    next_progress_count += 1000
                     print(
                         f"\rProgress: {copied_msg_count}/{total_msgs} messages ({copied_msg_count/total_msgs*100:.1f}%)",
                         end="",
@@ -403,47 +540,85 @@ class OverlapVerb(VerbExtension):
         print(f" End:      {end}")
         print(f" Duration: {end - start}")
 
+    def _select_tick_locator(self, mdates, seconds: int):
+        """Select the date locator and format giving the number of ticks closest to the target."""
+        best = None           # (score, locator, fmt, ticks)
+        best_over = None      # minimal ticks above max
+        best_under = None     # maximal ticks below min
+
+        for locator_name, interval_arg, unit_sec, fmt_str in TICK_UNITS:
+            # integer ceil and floor of the tick interval and count
+            interval = max(1, (seconds + unit_sec * TICK_TARGET - 1) // (unit_sec * TICK_TARGET))
+            ticks = max(2, seconds // (unit_sec * interval) + 1)
+
+            if TICK_MIN <= ticks <= TICK_MAX:
+                score = abs(ticks - TICK_TARGET)
+                if best is None or score < best[0]:
+                    best = (score, locator_name, interval_arg, interval, fmt_str)
+            elif ticks > TICK_MAX:
+                if best_over is None or ticks < best_over[0]:
+                    best_over = (ticks, locator_name, interval_arg, interval, fmt_str)
+            else:  # ticks < TICK_MIN
+                if best_under is None or ticks > best_under[0]:
+                    best_under = (ticks, locator_name, interval_arg, interval, fmt_str)
+
+        choice = best or best_over or best_under
+        if choice is None:
+            return mdates.MonthLocator(interval=2), '%Y-%m'
+        _, locator_name, interval_arg, interval, fmt_str = choice
+        # only the selected locator is created
+        return getattr(mdates, locator_name)(**{interval_arg: interval}), fmt_str
+
     def _plot_bag_time_ranges(self, time_ranges):
         """Plot the time ranges of the bag files."""
         try:
             import matplotlib.pyplot as plt
             import matplotlib.dates as mdates
             import matplotlib.ticker as mticker
-            import math
+            import numpy as np
             from datetime import timedelta
         except ImportError:
             raise ImportError("Plotting requires matplotlib. Install with: pip install matplotlib")
 
         fig, ax = plt.subplots(figsize=(12, 6))
 
-        # Calculate overall time span
-        all_times = [start for start, _, _ in time_ranges] + [end for _, end, _ in time_ranges]
-        min_time = min(all_times)
-        max_time = max(all_times)
+        # Calculate overall time span and overlap in a single pass
+        min_time = datetime.max
+        max_time = datetime.min
+        overlap_start = datetime.min
+        overlap_end = datetime.max
+        for start, end, _ in time_ranges:
+            min_time = min(min_time, start, end)
+            max_time = max(max_time, start, end)
+            if start > overlap_start:
+                overlap_start = start
+            if end < overlap_end:
+                overlap_end = end
         total_span = max_time - min_time
         total_seconds = max(total_span.total_seconds(), 0.0)
 
-        # Plot each bag's time range using Matplotlib date numbers (in days)
-        for i, (start, end, path) in enumerate(time_ranges):
-            bag_name = os.path.basename(path.rstrip("/"))
-            start_num = mdates.date2num(start)
-            end_num = mdates.date2num(end)
-            width_days = end_num - start_num
-            if width_days == 0:
-                # ensure visibility for zero-duration ranges (use 1 second width)
-                width_days = 1.0 / 86400.0
-            ax.barh(
-                i,
-                width_days,
-                left=start_num,
-                height=0.6,
-                alpha=0.7,
-                label=bag_name,
-            )
+        # Plot all bags' time ranges at once, using Matplotlib date numbers (in days)
+        bag_names = [os.path.basename(path.rstrip("/")) for _, _, path in time_ranges]
+        starts_num = mdates.date2num(
+            np.array([start for start, _, _ in time_ranges], dtype='datetime64[us]'))
+        ends_num = mdates.date2num(
+            np.array([end for _, end, _ in time_ranges], dtype='datetime64[us]'))
+        widths_days = ends_num - starts_num
+        # ensure visibility for zero-duration ranges (use 1 second width)
+        widths_days[widths_days == 0] = 1.0 / 86400.0
+        ax.barh(
+            np.arange(len(time_ranges)),
+            widths_days,
+            left=starts_num,
+            height=0.6,
+            alpha=0.7,
+            # one color per bag, as separate barh calls would cycle them
+            color=[f"C{i % 10}" for i in range(len(time_ranges))],
+        )
 
         # Format the plot
         ax.set_yticks(range(len(time_ranges)))
-        ax.set_yticklabels([os.path.basename(path.rstrip("/")) for _, _, path in time_ranges])
+        ax.set_yticklabels(bag_names)
         ax.set_xlabel('Time')
         ax.set_title('Bag File Time Ranges')
         ax.invert_yaxis()  # First input bag at top, last at bottom
@@ -462,53 +637,13 @@ class OverlapVerb(VerbExtension):
         ax.xaxis_date()
 
         # Use a manual locator/formatter selection targeting ~8 ticks to avoid too few (e.g., only years)
-        min_ticks, target, max_ticks = 4, 8, 10
-        seconds = total_seconds if total_seconds > 0 else 1.0
-        # unit name, seconds per unit, locator factory, formatter string
-        units = [
-            ("year",   365 * 86400.0, lambda n: mdates.YearLocator(base=int(n)),   '%Y'),
-            ("month",   30 * 86400.0, lambda n: mdates.MonthLocator(interval=int(n)), '%Y-%m'),
-            ("day",           86400.0, lambda n: mdates.DayLocator(interval=int(n)),   '%m-%d'),
-            ("hour",            3600.0, lambda n: mdates.HourLocator(interval=int(n)),  '%m-%d %H:%M'),
-            ("minute",            60.0, lambda n: mdates.MinuteLocator(interval=int(n)), '%H:%M'),
-            ("second",             1.0, lambda n: mdates.SecondLocator(interval=int(n)), '%H:%M:%S'),
-        ]
-
-        best = None           # (score, locator, fmt, ticks)
-        best_over = None      # minimal ticks above max
-        best_under = None     # maximal ticks below min
-
-        for _, unit_sec, factory, fmt_str in units:
-            count = seconds / unit_sec
-            interval = max(1, int(math.ceil(count / target)))
-            ticks = int(max(2, math.floor(count / interval) + 1))
-
-            if min_ticks <= ticks <= max_ticks:
-                score = abs(ticks - target)
-                cand = (score, factory(interval), fmt_str, ticks)
-                if best is None or score < best[0]:
-                    best = cand
-            elif ticks > max_ticks:
-                cand = (ticks, factory(interval), fmt_str, ticks)
-                if best_over is None or ticks < best_over[0]:
-                    best_over = cand
-            else:  # ticks < min_ticks
-                cand = (ticks, factory(interval), fmt_str, ticks)
-                if best_under is None or ticks > best_under[0]:
-                    best_under = cand
-
-        if best is not None:
-            locator = best[1]
-            fmt = best[2]
-        elif best_over is not None:
-            locator = best_over[1]
-            fmt = best_over[2]
-        elif best_under is not None:
-            locator = best_under[1]
-            fmt = best_under[2]
+        seconds = max(1, int(total_seconds))
+        if seconds < 60:
+            # only a second locator yields more than two ticks on spans below a minute
+            locator = mdates.SecondLocator(interval=(seconds + TICK_TARGET - 1) // TICK_TARGET)
+            fmt = '%H:%M:%S'
         else:
-            locator = mdates.MonthLocator(interval=2)
-            fmt = '%Y-%m'
+            locator, fmt = self._select_tick_locator(mdates, seconds)
 
         ax.xaxis.set_major_locator(locator)
         ax.xaxis.set_major_formatter(mdates.DateFormatter(fmt))
@@ -521,8 +656,6 @@ class OverlapVerb(VerbExtension):
             label.set_horizontalalignment('right')
 
         # Highlight overlap region if it exists
-        overlap_start = max(start for start, _, _ in time_ranges)
-        overlap_end = min(end for _, end, _ in time_ranges)
         if overlap_start < overlap_end:
             ax.axvspan(
                 mdates.date2num(overlap_start),
@@ -12,18 +12,122 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from collections import defaultdict
 from datetime import datetime, timezone
+from functools import lru_cache
+import sys
+from time import gmtime
 from zoneinfo import ZoneInfo
 
-from rclpy.time import Time
+import numpy as np
+
+from rclpy.serialization import deserialize_message
+
 from ros2bag.api import add_standard_reader_args
 from ros2bag.verb import VerbExtension
+
+from ros2bag_tools.filter.frame_id import CDR_LE
+from ros2bag_tools.filter.frame_id import has_leading_header
 from ros2bag_tools.verb import get_reader_options
 
 from rosbag2_py import SequentialReader
 from rosbag2_py import StorageFilter
-from rosbag2_tools.bag_view import BagView
+
+from rosidl_runtime_py.utilities import get_message
+
+
+# header.stamp of a message starting with a header, after the 4 byte encapsulation header
+_STAMP_DTYPE = np.dtype([('sec', '<i4'), ('nanosec', '<u4')])
+_STAMP_SLICE = slice(4, 12)
+# number of stamps per topic converted to deltas at once
+BATCH_SIZE = 4096
+
+
+@lru_cache(maxsize=None)
+def _load_header_type(type_name):
+    """
+    Load a message type with a header field, None if it has none or cannot be loaded.
+
+    Topics of the same type share the result, so each type is only inspected once.
+    """
+    try:
+        msg_type = get_message(type_name)
+    except (AttributeError, ModuleNotFoundError, ValueError):
+        return None
+    if 'header' not in msg_type.get_fields_and_field_types():
+        return None
+    return msg_type
+
+
+# time zone stamps are printed in
+_BERLIN_TZ = ZoneInfo('Europe/Berlin')
+
+
+@lru_cache(maxsize=None)
+def _berlin_utc_offset(utc_hour):
+    """
+    Return the UTC offset of Europe/Berlin in seconds during an hour since epoch.
+
+    The offset only changes at full hours (daylight saving time), so it is looked up once
+    per hour and the time zone database is not queried for every timestamp.
+    """
+    dt = datetime.fromtimestamp(utc_hour * 3600, tz=timezone.utc)
+    return int(dt.astimezone(_BERLIN_TZ).utcoffset().total_seconds())
+
+
+class TopicStats:
+    """Statistics of the messages of one topic."""
+
+    __slots__ = ('count', 'first_msg', 'last_msg', 'last_data', 'last_time',
+                 'delta_sum', 'delta_min', 'delta_max', 'delta_count',
+                 'batch_times', 'batch_stamps')
+
+    def __init__(self):
+        self.count = 0
+        self.first_msg = None
+        self.last_msg = None
+        # serialized last message and its receive time, message info is only made for it
+        self.last_data = None
+        self.last_time = None
+        # header deltas in nanoseconds, accumulated without keeping them
+        self.delta_sum = 0
+        self.delta_min = None
+        self.delta_max = None
+        self.delta_count = 0
+        # receive times and serialized header stamps not yet accumulated
+        self.batch_times = []
+        self.batch_stamps = []
+
+    def add_delta(self, delta_ns):
+        self._add_deltas(delta_ns, delta_ns, delta_ns, 1)
+
+    def add_stamp(self, received_time_ns, stamp_data):
+        """Add a CDR serialized header stamp, the delta is computed with the whole batch."""
+        self.batch_times.append(received_time_ns)
+        self.batch_stamps.append(stamp_data)
+        if len(self.batch_times) >= BATCH_SIZE:
+            self.flush_stamps()
+
+    def flush_stamps(self):
+        """Accumulate the deltas of all batched stamps."""
+        if not self.batch_times:
+            return
+        stamps = np.frombuffer(b''.join(self.batch_stamps), dtype=_STAMP_DTYPE)
+        deltas = np.array(self.batch_times, dtype=np.int64) - (
+            stamps['sec'].astype(np.int64) * 1000000000 + stamps['nanosec'])
+        # summed as python ints, a few deltas of zero stamps already overflow int64
+        self._add_deltas(sum(deltas.tolist()), int(deltas.min()), int(deltas.max()), len(deltas))
+        self.batch_times = []
+        self.batch_stamps = []
+
+    def _add_deltas(self, delta_sum, delta_min, delta_max, delta_count):
+        if self.delta_count == 0:
+            self.delta_min = delta_min
+            self.delta_max = delta_max
+        else:
+            self.delta_min = min(self.delta_min, delta_min)
+            self.delta_max = max(self.delta_max, delta_max)
+        self.delta_sum += delta_sum
+        self.delta_count += delta_count
 
 
 class PrintStampStatsVerb(VerbExtension):
@@ -47,17 +151,8 @@ class PrintStampStatsVerb(VerbExtension):
         reader = SequentialReader()
         reader.open(storage_options, converter_options)
 
-        # Data structures to store statistics
-        topic_stats = defaultdict(lambda: {
-            'messages': [],
-            'deltas': [],
-            'first_msg': None,
-            'last_msg': None,
-            'count': 0
-        })
-
-        # Keep track of which topics we've seen first messages for (for non-verbose mode)
-        topics_with_first_msg = set()
+        # Statistics per topic, added on the topic's first message
+        topic_stats = {}
         
         # In non-verbose mode, we need to know how many topics to expect
         # Get all topic names from the bag metadata and exclude topics with zero messages
@@ -66,164 +161,206 @@ class PrintStampStatsVerb(VerbExtension):
                                for topic_info in bag_metadata.topics_with_message_count 
                                if topic_info.message_count > 0}
         
+        # Message types of topics with headers, None for topics without
+        header_types = {topic.name: _load_header_type(topic.type)
+                        for topic in reader.get_all_topics_and_types()}
+
         # Filter topics if specified
         if args.topics:
             storage_filter = StorageFilter(topics=args.topics)
-            expected_topics = set(args.topics) & topics_with_messages
+            expected_topics = frozenset(args.topics) & topics_with_messages
         else:
-            storage_filter = StorageFilter()  # No filter, process all topics
-            expected_topics = topics_with_messages
+            # Only read topics with headers, so the storage skips all other messages
+            header_topics = [topic for topic, msg_type in header_types.items()
+                             if msg_type is not None]
+            if not header_topics:
+                print("No topics with headers found in the bag.")
+                return 0
+            storage_filter = StorageFilter(topics=header_topics)
+            expected_topics = frozenset(header_topics) & topics_with_messages
 
         # No header/separator in compact mode
         if not args.verbose:
             # Slim header row in compact mode (no separator line)
             print(f"{'Topic'.ljust(30)}{'Received'.ljust(30)} {'Header'.ljust(30)}")
 
-        # Process all messages
-        for topic, msg, t in BagView(reader, storage_filter):
-            # In non-verbose mode, skip if we already have the first message for this topic
-            if not args.verbose and topic in topics_with_first_msg:
-                continue
+        # Local names for everything used per message, so the loop does not look them up
+        verbose = args.verbose
+        has_next = reader.has_next
+        read_next = reader.read_next
+        make_msg_info = self._make_msg_info
+        target_topic_count = len(expected_topics)
+        # topics whose header stamp can be read from the serialized message directly
+        stamp_in_place = {topic: msg_type is not None and has_leading_header(msg_type)
+                          for topic, msg_type in header_types.items()}
 
-            # Get timestamps
-            received_time_ns = t
-            
-            # Check if message has header
-            if hasattr(msg, 'header'):
-                header_stamp_ns = Time.from_msg(msg.header.stamp).nanoseconds
-                delta_ns = received_time_ns - header_stamp_ns
-                
-                # Store message info with header
-                msg_info = {
-                    'topic': topic,
-                    'has_header': True,
-                    'received_time_ns': received_time_ns,
-                    'header_stamp_ns': header_stamp_ns,
-                    'delta_ns': delta_ns,
-                    'received_time': self._nanoseconds_to_datetime(received_time_ns),
-                    'header_stamp': self._nanoseconds_to_datetime(header_stamp_ns),
-                    'delta_ms': delta_ns / 1e6  # Convert to milliseconds
-                }
-            else:
-                # Store message info without header
-                msg_info = {
-                    'topic': topic,
-                    'has_header': False,
-                    'received_time_ns': received_time_ns,
-                    'header_stamp_ns': None,
-                    'delta_ns': None,
-                    'received_time': self._nanoseconds_to_datetime(received_time_ns),
-                    'header_stamp': None,
-                    'delta_ms': None
-                }
-
-            # Update topic statistics
-            stats = topic_stats[topic]
-            if args.verbose:
-                stats['messages'].append(msg_info)
-                if msg_info['has_header']:
-                    stats['deltas'].append(delta_ns)
-            stats['count'] += 1
-
-            # Track first and last messages
-            if stats['first_msg'] is None:
-                stats['first_msg'] = msg_info
-                topics_with_first_msg.add(topic)
-                
-                # In non-verbose mode, break early if we've seen all expected topics
-                if not args.verbose and len(topics_with_first_msg) >= len(expected_topics):
-                    #print(f"Found first message for all {len(expected_topics)} topics, stopping early...")
-                    break
-                    
-            if args.verbose:
-                stats['last_msg'] = msg_info
+        if not verbose:
+            # Only the first message of each topic is needed, so each topic is read on its own
+            # from the start of the bag. Sparse topics then do not require reading all messages
+            # of other topics recorded before them.
+            for topic in expected_topics:
+                reader.set_filter(StorageFilter(topics=[topic]))
+                # seek to time 0 instead of the bag start, whose type differs between distros
+                reader.seek(0)
+                if has_next():
+                    (_, data, t) = read_next()
+                    stats = topic_stats[topic] = TopicStats()
+                    stats.count = 1
+                    stats.first_msg = make_msg_info(header_types[topic], data, t)
+            # List topics in the order of their first message, as when reading them together
+            topic_stats = dict(sorted(
+                topic_stats.items(), key=lambda item: item[1].first_msg['received_time_ns']))
+        else:
+            # Process all messages
+            reader.set_filter(storage_filter)
+            while has_next():
+                (topic, data, t) = read_next()
+                # In non-verbose mode, skip if we already have the first message for this topic
+                if not verbose and topic in topic_stats:
+                    continue
+
+                # Update topic statistics
+                msg_type = header_types[topic]
+                stats = topic_stats.get(topic)
+                if stats is None:
+                    # Only the first and last messages are printed, so message info is only
+                    # made for them. Times are formatted when printing.
+                    stats = topic_stats[topic] = TopicStats()
+                    stats.first_msg = make_msg_info(msg_type, data, t)
+                stats.count += 1
+                if not verbose:
+                    # In non-verbose mode, break early if we've seen all expected topics
+                    if len(topic_stats) >= target_topic_count:
+                        break
+                    continue
+
+                stats.last_data = data
+                stats.last_time = t
+                if msg_type is None:
+                    continue
+                if stamp_in_place[topic] and data[:2] == CDR_LE:
+                    # the stamp is read from the serialized message without deserializing it
+                    stats.add_stamp(t, data[_STAMP_SLICE])
+                else:
+                    stamp = deserialize_message(data, msg_type).header.stamp
+                    stats.add_delta(t - (stamp.sec * 1000000000 + stamp.nanosec))
+
+            for topic, stats in topic_stats.items():
+                stats.flush_stamps()
+                if stats.last_data is not None:
+                    stats.last_msg = make_msg_info(
+                        header_types[topic], stats.last_data, stats.last_time)
 
         if not topic_stats:
             print("No messages found in the bag.")
             return 0
 
+        # Collect the output and write it at once
+        lines = []
+        out = lines.append
+
         # Print statistics for each topic
         if args.verbose:
             # Verbose mode - detailed multi-line output
             for topic, stats in topic_stats.items():
-                print(f"\nTopic: {topic}")
-                print("-" * 40)
-                print(f"Total messages: {stats['count']}")
+                out(f"\nTopic: {topic}")
+                out("-" * 40)
+                out(f"Total messages: {stats.count}")
 
-                if stats['count'] > 0:
+                if stats.count > 0:
                     # Always show first message info
-                    first_msg = stats['first_msg']
-                    print(f"\nFirst message:")
-                    if first_msg['has_header']:
-                        print(f"  Header stamp:   {first_msg['header_stamp']}")
-                        print(f"  Received time:  {first_msg['received_time']}")
-                        print(f"  Delta:          {first_msg['delta_ms']:.5f} ms")
+                    first = stats.first_msg
+                    out(f"\nFirst message:")
+                    if first['header_stamp_ns'] is not None:
+                        out(f"  Header stamp:   {self._nanoseconds_to_datetime(first['header_stamp_ns'])}")
+                        out(f"  Received time:  {self._nanoseconds_to_datetime(first['received_time_ns'])}")
+                        out(f"  Delta:          {first['delta_ns'] / 1e6:.5f} ms")
                     else:
-                        print(f"  Received time:  {first_msg['received_time']}")
-                        print(f"  (No header in message)")
+                        out(f"  Received time:  {self._nanoseconds_to_datetime(first['received_time_ns'])}")
+                        out(f"  (No header in message)")
 
                     # Last message info (only if different from first)
-                    if stats['count'] > 1:
-                        last_msg = stats['last_msg']
-                        print(f"\nLast message:")
-                        if last_msg['has_header']:
-                            print(f"  Header stamp:   {last_msg['header_stamp']}")
-                            print(f"  Received time:  {last_msg['received_time']}")
-                            print(f"  Delta:          {last_msg['delta_ms']:.5f} ms")
+                    if stats.count > 1:
+                        last = stats.last_msg
+                        out(f"\nLast message:")
+                        if last['header_stamp_ns'] is not None:
+                            out(f"  Header stamp:   {self._nanoseconds_to_datetime(last['header_stamp_ns'])}")
+                            out(f"  Received time:  {self._nanoseconds_to_datetime(last['received_time_ns'])}")
+                            out(f"  Delta:          {last['delta_ns'] / 1e6:.5f} ms")
                         else:
-                            print(f"  Received time:  {last_msg['received_time']}")
-                            print(f"  (No header in message)")
+                            out(f"  Received time:  {self._nanoseconds_to_datetime(last['received_time_ns'])}")
+                            out(f"  (No header in message)")
 
                     # Average delta (only for topics with headers)
-                    if len(stats['deltas']) > 0:
-                        avg_delta_ns = sum(stats['deltas']) / len(stats['deltas'])
-                        avg_delta_ms = avg_delta_ns / 1e6
-                        print(f"\nAverage delta (received - header): {avg_delta_ms:.5f} ms")
+                    if stats.delta_count > 0:
+                        avg_delta_ms = stats.delta_sum / stats.delta_count / 1e6
+                        out(f"\nAverage delta (received - header): {avg_delta_ms:.5f} ms")
 
                         # Additional statistics
-                        if len(stats['deltas']) > 1:
-                            min_delta_ms = min(stats['deltas']) / 1e6
-                            max_delta_ms = max(stats['deltas']) / 1e6
-                            print(f"Delta range: {min_delta_ms:.5f} ms to {max_delta_ms:.5f} ms")
+                        if stats.delta_count > 1:
+                            min_delta_ms = stats.delta_min / 1e6
+                            max_delta_ms = stats.delta_max / 1e6
+                            out(f"Delta range: {min_delta_ms:.5f} ms to {max_delta_ms:.5f} ms")
         else:
             # Compact mode - one line per topic, fixed-width columns, no header row
             for topic, stats in topic_stats.items():
-                if stats['count'] > 0:
-                    first_msg = stats['first_msg']
+                if stats.count > 0:
+                    first = stats.first_msg
 
-                    received_str = first_msg['received_time']
-                    header_str = first_msg['header_stamp'] if first_msg['has_header'] else "N/A"
+                    received_str = self._nanoseconds_to_datetime(first['received_time_ns'])
+                    if first['header_stamp_ns'] is not None:
+                        header_str = self._nanoseconds_to_datetime(first['header_stamp_ns'])
+                    else:
+                        header_str = "N/A"
 
                     # Columns: Topic (30) | Received (30) | Header (30)
                     topic_short = topic[:29] if len(topic) > 29 else topic
-                    print(f"{topic_short.ljust(30)}{received_str.ljust(30)} {header_str.ljust(30)}")
+                    out(f"{topic_short.ljust(30)}{received_str.ljust(30)} {header_str.ljust(30)}")
 
         # Summary across all topics (only in verbose mode)
         if args.verbose and len(topic_stats) > 1:
-            print(f"\n{'='*60}")
-            print("SUMMARY ACROSS ALL TOPICS")
-            print(f"{'='*60}")
+            out(f"\n{'='*60}")
+            out("SUMMARY ACROSS ALL TOPICS")
+            out(f"{'='*60}")
             
-            total_messages = sum(stats['count'] for stats in topic_stats.values())
-            all_deltas = []
-            for stats in topic_stats.values():
-                all_deltas.extend(stats['deltas'])
+            total_messages = sum(stats.count for stats in topic_stats.values())
+            delta_stats = [stats for stats in topic_stats.values() if stats.delta_count > 0]
             
-            if all_deltas:
-                avg_delta_ms = sum(all_deltas) / len(all_deltas) / 1e6
-                min_delta_ms = min(all_deltas) / 1e6
-                max_delta_ms = max(all_deltas) / 1e6
+            if delta_stats:
+                delta_count = sum(stats.delta_count for stats in delta_stats)
+                avg_delta_ms = sum(stats.delta_sum for stats in delta_stats) / delta_count / 1e6
+                min_delta_ms = min(stats.delta_min for stats in delta_stats) / 1e6
+                max_delta_ms = max(stats.delta_max for stats in delta_stats) / 1e6
                 
-                print(f"Total messages analyzed: {total_messages}")
-                print(f"Topics analyzed: {len(topic_stats)}")
-                print(f"Overall average delta: {avg_delta_ms:.5f} ms")
-                print(f"Overall delta range: {min_delta_ms:.5f} ms to {max_delta_ms:.5f} ms")
+                out(f"Total messages analyzed: {total_messages}")
+                out(f"Topics analyzed: {len(topic_stats)}")
+                out(f"Overall average delta: {avg_delta_ms:.5f} ms")
+                out(f"Overall delta range: {min_delta_ms:.5f} ms to {max_delta_ms:.5f} ms")
 
+        sys.stdout.write('\n'.join(lines) + '\n')
         return 0
 
+    def _make_msg_info(self, msg_type, data, received_time_ns):
+        """Get the times of a serialized message, msg_type is None for messages without header."""
+        # Only messages with a header are deserialized, others only need their time
+        if msg_type is None:
+            header_stamp_ns = None
+            delta_ns = None
+        else:
+            stamp = deserialize_message(data, msg_type).header.stamp
+            header_stamp_ns = stamp.sec * 1000000000 + stamp.nanosec
+            delta_ns = received_time_ns - header_stamp_ns
+        # raw times only, they are formatted when printing
+        return {
+            'received_time_ns': received_time_ns,
+            'header_stamp_ns': header_stamp_ns,
+            'delta_ns': delta_ns,
+        }
+
     def _nanoseconds_to_datetime(self, nanoseconds):
         """Convert nanoseconds since epoch to datetime string in Europe/Berlin."""
-        seconds = nanoseconds / 1e9
-        dt = datetime.fromtimestamp(seconds, tz=timezone.utc).astimezone(ZoneInfo('Europe/Berlin'))
-        return dt.strftime("%Y-%m-%d %H:%M:%S.%f")
-
+        # rounded to microseconds, as datetime does
+        seconds, microseconds = divmod((nanoseconds + 500) // 1000, 1000000)
+        t = gmtime(seconds + _berlin_utc_offset(seconds // 3600))
+        return (f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d} "
+                f"{t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d}.{microseconds:06d}")
@@ -14,19 +14,49 @@
 
 import os
 import subprocess
+import sys
 import tempfile
+import threading
+import uuid
 import yaml
 import glob
 import shutil
+from argparse import Namespace
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 
 from ros2bag.verb import VerbExtension
 from ros2bag.api import print_error
+from ros2bag_tools.verb import copy_bag
+from ros2bag_tools.verb import print_error_locked
+from ros2bag_tools.verb import print_locked
+from ros2bag_tools.verb import rewrite_bag
+
+from rosbag2_py import StorageOptions
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeDumper
+    from yaml import SafeLoader
+
+
+# units used for printing sizes, largest first
+_SIZE_STEPS = ((1 << 30, 'GiB'), (1 << 20, 'MiB'), (1 << 10, 'KiB'))
 
 
 class SplitVerb(VerbExtension):
     """Split ROS2 bags into multiple files with configurable maximum file size."""
 
+    def __init__(self):
+        super().__init__()
+        # bag path -> parsed bag information of its metadata.yaml, None if unreadable
+        self._meta_cache = {}
+        # threads deleting replaced bags, joined before main returns
+        self._cleanup_threads = []
+
     def add_arguments(self, parser, cli_name):
         parser.add_argument(
             'input_bags',
@@ -42,7 +72,23 @@ class SplitVerb(VerbExtension):
             '--max-size',
             type=int,
             default=1000000000,  # 1GB
-            help='Maximum bagfile size in bytes (default: 1000000000 = 1GB)'
+            help='Maximum bagfile size in bytes (default: 1000000000 = 1GB). Data files of '
+                 'uncompressed bags already within it are hard-linked into the output if '
+                 'possible, sharing their inodes with the input'
+        )
+        parser.add_argument(
+            '--start-time-ns',
+            type=int,
+            default=None,
+            help='Only keep messages received at or after this time in nanoseconds '
+                 '(time slices are always split in this process)'
+        )
+        parser.add_argument(
+            '--end-time-ns',
+            type=int,
+            default=None,
+            help='Only keep messages received at or before this time in nanoseconds '
+                 '(time slices are always split in this process)'
         )
         parser.add_argument(
             '--inplace',
@@ -66,24 +112,41 @@ class SplitVerb(VerbExtension):
             action='store_true',
             help='Print the YAML configuration used for splitting'
         )
+        parser.add_argument(
+            '--no-subprocess',
+            action='store_true',
+            help='Split in this process with rosbag2_py instead of running ros2 bag convert'
+        )
+        parser.add_argument(
+            '-j', '--jobs',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of bags to split in parallel (default: number of CPU cores)'
+        )
 
     def main(self, *, args):
         # Expand glob patterns and validate inputs
         input_bags = []
+        # real paths of bags already matched, overlapping patterns must not split a bag twice
+        seen = set()
         for pattern in args.input_bags:
             # Strip trailing slashes for proper naming
             pattern = pattern.rstrip('/')
             
             # Expand glob pattern
-            matches = glob.glob(pattern)
-            if matches:
+            matched = False
+            for match in glob.iglob(pattern):
+                matched = True
+                real_path = os.path.realpath(match)
+                if real_path in seen:
+                    continue
+                seen.add(real_path)
                 # Filter to only valid bag directories
-                for match in matches:
-                    if self._is_valid_bag(match):
-                        input_bags.append(match)
-                    else:
-                        print(f"Warning: Skipping '{match}' - not a valid ROS2 bag")
-            else:
+                if self._is_valid_bag(match):
+                    input_bags.append(match)
+                else:
+                    print(f"Warning: Skipping '{match}' - not a valid ROS2 bag")
+            if not matched:
                 # No glob matches, check if it's a direct path
                 if self._is_valid_bag(pattern):
                     input_bags.append(pattern)
@@ -105,53 +168,54 @@ class SplitVerb(VerbExtension):
             print_error("Cannot use both --inplace and --output options together")
             return 1
 
+        if (args.start_time_ns is not None and args.end_time_ns is not None and
+                args.start_time_ns > args.end_time_ns):
+            print_error("Start time must not be after end time")
+            return 1
+
+        if args.jobs < 1:
+            print_error("Number of jobs must be at least 1")
+            return 1
+
         print(f"Found {len(input_bags)} valid bag(s) to split")
         
         success_count = 0
         total_count = len(input_bags)
         
-        for input_bag in input_bags:
-            if args.inplace:
-                output_bag = f"{input_bag}_temp_split"
-            else:
-                output_bag = args.output if args.output else f"{input_bag}_split"
-            
-            # Get original bag info if validation is requested
-            original_info = None
-            original_messages = None
-            if args.validate:
+        # ros2 bag convert runs in its own process, so threads split bags in parallel. The
+        # in-process copy loop holds the GIL, so in-process splits use separate processes.
+        jobs = min(args.jobs, total_count)
+        in_process = (args.no_subprocess or
+                      args.start_time_ns is not None or args.end_time_ns is not None)
+        if jobs > 1 and in_process:
+            # only plain options are sent to the workers, the parsed args are not picklable
+            options = Namespace(**{name: getattr(args, name) for name in (
+                'output', 'max_size', 'start_time_ns', 'end_time_ns', 'inplace', 'validate',
+                'verbose', 'no_subprocess')})
+            executor = ProcessPoolExecutor(max_workers=jobs)
+            process_one_bag = _split_bag
+        else:
+            executor = ThreadPoolExecutor(max_workers=jobs)
+            process_one_bag = self._process_one_bag
+            options = args
+        with executor:
+            futures = {executor.submit(process_one_bag, input_bag, options): input_bag
+                       for input_bag in input_bags}
+            for future in as_completed(futures):
                 try:
-                    result = subprocess.run(
-                        ['ros2', 'bag', 'info', input_bag],
-                        capture_output=True,
-                        text=True,
-                        check=True
-                    )
-                    original_info = result.stdout
-                    # Extract message count
-                    for line in original_info.split('\n'):
-                        if 'Messages:' in line:
-                            original_messages = int(line.split(':')[1].strip())
-                            break
-                except (subprocess.CalledProcessError, ValueError):
-                    print(f"Warning: Could not get original message count for {input_bag}")
-
-            # Split the bag
-            if self._split_single_bag(input_bag, output_bag, args, original_info, original_messages):
-                # Handle inplace replacement
-                if args.inplace:
-                    try:
-                        # Remove original and rename split version
-                        shutil.rmtree(input_bag)
-                        os.rename(output_bag, input_bag)
-                        print(f"✅ Replaced original bag with split version")
-                    except (OSError, IOError) as e:
-                        print_error(f"Failed to replace original bag: {e}")
-                        print_error(f"Split bag is available at: {output_bag}")
-                        return 1
-                success_count += 1
-            else:
-                print_error(f"Failed to split: {input_bag}")
+                    split = future.result()
+                except BrokenProcessPool as e:
+                    # a crashed worker, e.g. in native rosbag2 code, fails its pending bags
+                    print_error_locked(f"Split worker of {futures[future]} died: {e}")
+                    split = False
+                if split:
+                    success_count += 1
+                else:
+                    print_error_locked(f"Failed to split: {futures[future]}")
+
+        # Wait for replaced bags to be deleted
+        for thread in self._cleanup_threads:
+            thread.join()
 
         # Summary
         if total_count > 1:
@@ -159,173 +223,275 @@ class SplitVerb(VerbExtension):
         
         return 0 if success_count == total_count else 1
 
+    def _process_one_bag(self, input_bag, args):
+        """Split a single bag and replace it if requested, return whether it succeeded."""
+        if args.inplace:
+            output_bag = f"{input_bag}_temp_split"
+        else:
+            output_bag = args.output if args.output else f"{input_bag}_split"
+        
+        # Get original bag info, a time slice drops messages on purpose
+        original_stats = None
+        if args.start_time_ns is None and args.end_time_ns is None:
+            try:
+                original_stats = self._read_bag_metadata(input_bag)
+            except (OSError, ValueError, KeyError):
+                if args.validate:
+                    print_locked(f"Warning: Could not get original message count for {input_bag}")
+
+        # An uncompressed bag within the maximum size would only be copied by ros2 bag convert,
+        # which writes compressed bags uncompressed
+        if (original_stats is not None and original_stats['size'] <= args.max_size and
+                not self._load_meta(input_bag).get('compression_format')):
+            max_size_str = self._format_size(args.max_size)
+            print_locked(f"Skipping split of {input_bag}: already within max size ({max_size_str})")
+            if args.inplace:
+                return True
+            try:
+                copy_bag(input_bag, output_bag)
+            except OSError as e:
+                print_error_locked(f"Failed to copy {input_bag} to {output_bag}: {e}")
+                return False
+            print_locked(f"✅ Copied unchanged bag to {output_bag}")
+            return True
+
+        # Split the bag
+        if not self._split_single_bag(input_bag, output_bag, args,
+                                      original_stats if args.validate else None):
+            return False
+
+        # Handle inplace replacement
+        if args.inplace:
+            try:
+                # Move original aside and the split version into place. Between the two
+                # renames nothing exists at input_bag, but the original survives as the
+                # .trash sibling until the split version is in place
+                trash = f"{input_bag}.trash"
+                if os.path.lexists(trash):
+                    trash = f"{trash}.{uuid.uuid4().hex}"
+                os.rename(input_bag, trash)
+                try:
+                    os.replace(output_bag, input_bag)
+                except OSError:
+                    os.rename(trash, input_bag)
+                    raise
+                self._meta_cache.pop(input_bag, None)
+                self._meta_cache.pop(output_bag, None)
+                print_locked(f"✅ Replaced original bag with split version")
+            except (OSError, IOError) as e:
+                print_error_locked(f"Failed to replace original bag: {e}")
+                print_error_locked(f"Split bag is available at: {output_bag}")
+                return False
+
+            # Delete the original while other bags are split
+            cleanup = threading.Thread(target=shutil.rmtree, args=(trash,),
+                                       kwargs={'ignore_errors': True})
+            cleanup.start()
+            self._cleanup_threads.append(cleanup)
+        return True
+
     def _is_valid_bag(self, bag_path):
         """Check if a directory is a valid ROS2 bag."""
-        if not os.path.isdir(bag_path):
+        # Check for metadata.yaml and at least one data file (mcap or db3) in one pass
+        try:
+            entries = os.scandir(bag_path)
+        except OSError:
             return False
-            
-        # Check for metadata.yaml
-        metadata_path = os.path.join(bag_path, 'metadata.yaml')
-        if not os.path.exists(metadata_path):
+        has_meta = has_data = False
+        with entries:
+            for entry in entries:
+                if entry.name == 'metadata.yaml':
+                    has_meta = True
+                elif entry.name.endswith(('.mcap', '.db3')):
+                    has_data = True
+                if has_meta and has_data:
+                    break
+        return has_meta and has_data and self._load_meta(bag_path) is not None
+
+    def _load_meta(self, bag_path):
+        """Return the bag information of a bag's metadata.yaml, None if it cannot be read."""
+        if bag_path not in self._meta_cache:
+            try:
+                with open(f"{bag_path}{os.sep}metadata.yaml", 'r') as f:
+                    meta = yaml.load(f, Loader=SafeLoader)['rosbag2_bagfile_information']
+            except (OSError, yaml.YAMLError, KeyError, TypeError):
+                meta = None
+            self._meta_cache[bag_path] = meta
+        return self._meta_cache[bag_path]
+
+    def _split_single_bag(self, input_bag, output_bag, args, original_stats=None):
+        """
+        Split a single bag file.
+
+        original_stats are the message count and size of the input bag as returned by
+        _read_bag_metadata, the message count is validated against them if given.
+        """
+        # Display split info
+        max_size_str = self._format_size(args.max_size)
+        print_locked(f"Splitting: {input_bag} -> {output_bag} (max size: {max_size_str})")
+
+        # not every distro's ros2 bag convert knows a time range, time slices are copied here
+        time_slice = args.start_time_ns is not None or args.end_time_ns is not None
+        if args.no_subprocess or time_slice:
+            try:
+                copied_messages = rewrite_bag(
+                    input_bag, StorageOptions(uri=output_bag, max_bagfile_size=args.max_size),
+                    args.start_time_ns, args.end_time_ns)
+            except (RuntimeError, OSError) as e:
+                print_error_locked(f"Split failed for {input_bag}!")
+                print_error_locked(str(e))
+                return False
+        elif not self._convert(input_bag, output_bag, args):
             return False
-            
-        # Check for at least one data file (mcap or db3)
-        data_files = glob.glob(os.path.join(bag_path, '*.mcap')) + \
-                    glob.glob(os.path.join(bag_path, '*.db3'))
-        return len(data_files) > 0
-
-    def _split_single_bag(self, input_bag, output_bag, args, original_info=None, original_messages=None):
-        """Split a single bag file."""
-        # Create temporary YAML configuration
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as temp_file:
-            config = {
-                'output_bags': [{
-                    'uri': output_bag,
-                    'max_bagfile_size': args.max_size,
-                    'all_topics': True
-                }]
-            }
-                
-            yaml.dump(config, temp_file, default_flow_style=False)
-            temp_yaml_path = temp_file.name
+
+        # Validate output exists
+        if not (os.path.exists(output_bag) and (os.path.isdir(output_bag) or os.path.isfile(output_bag))):
+            print_error_locked(f"Output bag not found after split: {output_bag}")
+            return False
+
+        # Check if the output bag has valid metadata, a previous output may be cached
+        self._meta_cache.pop(output_bag, None)
+        split_meta = self._load_meta(output_bag)
+        if split_meta is None:
+            print_error_locked(f"Output bag has missing or invalid metadata.yaml - split may have failed: {output_bag}")
+            return False
+
+        # Count split files
+        split_count = len(split_meta.get('relative_file_paths') or ())
+
+        # Validate message count if requested
+        if original_stats is not None:
+            try:
+                split_stats = self._read_bag_metadata(output_bag)
+            except (OSError, ValueError, KeyError) as e:
+                print_error_locked(f"Output bag appears to be corrupted - cannot read metadata: {output_bag}")
+                print_error_locked(str(e))
+                return False
+
+            original_messages = original_stats['messages']
+            split_messages = split_stats['messages']
+            if original_messages == split_messages:
+                original_size = original_stats['size']
+                split_size = split_stats['size']
+                if original_size and split_size:
+                    original_size_str = self._format_size(original_size)
+                    split_size_str = self._format_size(split_size)
+                    print_locked(f"✅ Success: {original_messages} messages preserved | "
+                           f"{original_size_str} -> {split_size_str} in {split_count} file(s)")
+                else:
+                    print_locked(f"✅ Success: {original_messages} messages preserved in {split_count} file(s)")
+            else:
+                print_error_locked(f"Message count mismatch! Original: {original_messages}, "
+                             f"Split: {split_messages}")
+                return False
+        elif args.validate and time_slice:
+            # a time slice drops messages on purpose, check the output against the copied ones
+            try:
+                split_messages = split_meta['message_count']
+                split_start = split_meta['starting_time']['nanoseconds_since_epoch']
+                split_end = split_start + split_meta['duration']['nanoseconds']
+            except (KeyError, TypeError) as e:
+                print_error_locked(f"Output bag appears to be corrupted - cannot read metadata: {output_bag}")
+                print_error_locked(str(e))
+                return False
+            if split_messages != copied_messages:
+                print_error_locked(f"Message count mismatch! Copied: {copied_messages}, "
+                             f"Split: {split_messages}")
+                return False
+            if split_messages and (
+                    (args.start_time_ns is not None and split_start < args.start_time_ns) or
+                    (args.end_time_ns is not None and split_end > args.end_time_ns)):
+                print_error_locked(f"Split bag exceeds the requested time range: {split_start} - {split_end}")
+                return False
+            print_locked(f"✅ Success: {split_messages} messages in time range in {split_count} file(s)")
+        else:
+            print_locked(f"✅ Split completed in {split_count} file(s)")
+
+        return True
+
+    def _convert(self, input_bag, output_bag, args):
+        """Split a bag with ros2 bag convert, return whether it succeeded."""
+        config = {
+            'output_bags': [{
+                'uri': output_bag,
+                'max_bagfile_size': args.max_size,
+                'all_topics': True
+            }]
+        }
+        config_yaml = yaml.dump(config, Dumper=SafeDumper, default_flow_style=False)
+
+        # Pass the YAML configuration through a pipe, which ros2 bag convert opens by its /dev/fd
+        # path. The config is far smaller than the pipe buffer, so it is written before convert
+        # starts. Without /dev/fd fall back to a temporary file.
+        config_fd = None
+        if sys.platform.startswith('linux'):
+            config_fd, write_fd = os.pipe()
+            with os.fdopen(write_fd, 'w') as pipe:
+                pipe.write(config_yaml)
+            config_path = f"/dev/fd/{config_fd}"
+        else:
+            with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as temp_file:
+                temp_file.write(config_yaml)
+                config_path = temp_file.name
 
         # Print YAML configuration if verbose mode is enabled
         if args.verbose:
-            print(f"\nYAML Configuration for {input_bag}:")
-            print("=" * 50)
-            print(yaml.dump(config, default_flow_style=False))
-            print("=" * 50)
+            rule = "=" * 50
+            print_locked(f"\nYAML Configuration for {input_bag}:\n{rule}\n{config_yaml}\n{rule}")
 
         try:
-            # Display split info
-            max_size_str = self._format_size(args.max_size)
-            print(f"Splitting: {input_bag} -> {output_bag} (max size: {max_size_str})")
-
-            # Run ros2 bag convert
-            result = subprocess.run(
-                ['ros2', 'bag', 'convert', '-i', input_bag, '-o', temp_yaml_path],
-                capture_output=True,
+            # Run ros2 bag convert, its progress output is discarded instead of buffered
+            proc = subprocess.Popen(
+                ['ros2', 'bag', 'convert', '-i', input_bag, '-o', config_path],
+                pass_fds=() if config_fd is None else (config_fd,),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
                 text=True
             )
-            
-            if result.returncode != 0:
-                print_error(f"Split failed for {input_bag}!")
-                print_error(result.stderr)
-                return False
+            stderr = proc.stderr.read()
+            proc.stderr.close()
 
-            # Validate output exists
-            if not (os.path.exists(output_bag) and (os.path.isdir(output_bag) or os.path.isfile(output_bag))):
-                print_error(f"Output bag not found after split: {output_bag}")
+            if proc.wait() != 0:
+                print_error_locked(f"Split failed for {input_bag}!")
+                print_error_locked(stderr)
                 return False
-
-            # Check if the output bag has valid metadata
-            metadata_path = os.path.join(output_bag, 'metadata.yaml')
-            if os.path.exists(metadata_path):
-                try:
-                    with open(metadata_path, 'r') as f:
-                        content = f.read().strip()
-                        if not content:
-                            print_error(f"Output bag has empty metadata.yaml - split may have failed: {output_bag}")
-                            return False
-                except Exception as e:
-                    print_error(f"Could not read metadata.yaml for {output_bag}: {e}")
-                    return False
-
-            # Count split files
-            split_files = glob.glob(os.path.join(output_bag, '*.mcap')) + \
-                         glob.glob(os.path.join(output_bag, '*.db3'))
-            split_count = len(split_files)
-
-            # Validate message count if requested
-            if args.validate and original_messages is not None:
-                try:
-                    result = subprocess.run(
-                        ['ros2', 'bag', 'info', output_bag],
-                        capture_output=True,
-                        text=True,
-                        check=False  # Don't raise exception, handle error manually
-                    )
-                    
-                    if result.returncode != 0:
-                        print_error(f"Output bag appears to be corrupted - cannot read bag info: {output_bag}")
-                        print_error(result.stderr)
-                        return False
-                        
-                    split_info = result.stdout
-                    split_messages = None
-                    
-                    # Extract message count
-                    for line in split_info.split('\n'):
-                        if 'Messages:' in line:
-                            split_messages = int(line.split(':')[1].strip())
-                            break
-                    
-                    if split_messages is not None:
-                        if original_messages == split_messages:
-                            # Try to calculate original and split sizes
-                            try:
-                                original_size = self._extract_bag_size(original_info)
-                                split_size = self._extract_bag_size(split_info)
-                                
-                                if original_size and split_size:
-                                    original_size_str = self._format_size(original_size)
-                                    split_size_str = self._format_size(split_size)
-                                    print(f"✅ Success: {original_messages} messages preserved | "
-                                          f"{original_size_str} -> {split_size_str} in {split_count} file(s)")
-                                else:
-                                    print(f"✅ Success: {original_messages} messages preserved in {split_count} file(s)")
-                            except:
-                                print(f"✅ Success: {original_messages} messages preserved in {split_count} file(s)")
-                        else:
-                            print_error(f"Message count mismatch! Original: {original_messages}, "
-                                      f"Split: {split_messages}")
-                            return False
-                    else:
-                        print(f"✅ Split completed in {split_count} file(s) (could not validate message count)")
-                        
-                except subprocess.CalledProcessError:
-                    print(f"✅ Split completed in {split_count} file(s) (could not validate message count)")
-            else:
-                print(f"✅ Split completed in {split_count} file(s)")
-
             return True
 
         finally:
-            # Clean up temporary file
+            # Clean up the config pipe or temporary file
             try:
-                os.unlink(temp_yaml_path)
+                if config_fd is not None:
+                    os.close(config_fd)
+                else:
+                    os.unlink(config_path)
             except OSError:
                 pass
 
-    def _extract_bag_size(self, bag_info):
-        """Extract bag size in bytes from ros2 bag info output."""
-        try:
-            for line in bag_info.split('\n'):
-                if 'Bag size:' in line:
-                    parts = line.split()
-                    if len(parts) >= 4:
-                        size_value = float(parts[2])
-                        unit = parts[3]
-                        
-                        if unit == 'GiB':
-                            return int(size_value * 1024 * 1024 * 1024)
-                        elif unit == 'MiB':
-                            return int(size_value * 1024 * 1024)
-                        elif unit == 'KiB':
-                            return int(size_value * 1024)
-                        else:  # bytes
-                            return int(size_value)
-        except (ValueError, IndexError):
-            pass
-        return None
+    def _read_bag_metadata(self, bag_path):
+        """Read message count and size in bytes of a bag from its metadata.yaml."""
+        info = self._load_meta(bag_path)
+        if info is None:
+            raise ValueError(f"Cannot read metadata.yaml of {bag_path}")
+        return {
+            'messages': info['message_count'],
+            'size': sum(os.path.getsize(f"{bag_path}{os.sep}{path}")
+                        for path in info['relative_file_paths']),
+        }
 
     def _format_size(self, size_bytes):
         """Format size in bytes to human readable format."""
-        if size_bytes >= 1024**3:
-            return f"{size_bytes / (1024**3):.1f} GiB"
-        elif size_bytes >= 1024**2:
-            return f"{size_bytes / (1024**2):.1f} MiB"
-        elif size_bytes >= 1024:
-            return f"{size_bytes / 1024:.1f} KiB"
-        else:
-            return f"{size_bytes} bytes"
+        for unit_bytes, unit in _SIZE_STEPS:
+            if size_bytes >= unit_bytes:
+                return f"{size_bytes / unit_bytes:.1f} {unit}"
+        return f"{size_bytes} bytes"
+
+
+def _split_bag(input_bag, options):
+    """Split one bag in a worker process when splitting in process in parallel."""
+    verb = SplitVerb()
+    try:
+        return verb._process_one_bag(input_bag, options)
+    finally:
+        # the worker may exit once the pool shuts down, replaced bags are deleted before that
+        for thread in verb._cleanup_threads:
+            thread.join()
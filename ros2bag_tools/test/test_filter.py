@@ -18,6 +18,7 @@ import logging
 from pathlib import Path
 
 from diagnostic_msgs.msg import DiagnosticArray
+from diagnostic_msgs.msg import DiagnosticStatus
 from example_interfaces.msg import String
 
 import pytest
@@ -30,6 +31,7 @@ from ros2bag_tools.filter.add import AddFilter
 from ros2bag_tools.filter.cut import CutFilter
 from ros2bag_tools.filter.drop import DropFilter
 from ros2bag_tools.filter.extract import ExtractFilter
+from ros2bag_tools.filter.frame_id import FrameIdFilter
 from ros2bag_tools.filter.reframe import ReframeFilter
 from ros2bag_tools.filter.rename import RenameFilter
 from ros2bag_tools.filter.replace import ReplaceFilter
@@ -245,6 +247,78 @@ def test_reframe_filter():
     assert (new_msg.header.frame_id == 'frame1')
 
 
+def test_frame_id_filter():
+    test_filter = FrameIdFilter()
+
+    parser = argparse.ArgumentParser('frame_id')
+    test_filter.add_arguments(parser)
+    args = parser.parse_args(
+        ['-t', '/diagnostics', '--frame_id', 'frame0:frame1',
+         '-t', '/diagnostics_any', '--frame_id', '*:a_much_longer_frame'])
+    test_filter.set_args(None, args)
+
+    for name in ['/diagnostics', '/diagnostics_any']:
+        topic_metadata = TopicMetadata(
+            name, 'diagnostic_msgs/msg/DiagnosticArray', 'cdr')
+        assert (test_filter.filter_topic(topic_metadata) == topic_metadata)
+
+    msg = DiagnosticArray()
+    msg.header.frame_id = 'frame0'
+    msg.header.stamp.sec = 1
+    msg.header.stamp.nanosec = 2
+    msg.status = [DiagnosticStatus(name='status', message='ok')]
+
+    (_, data, _) = test_filter.filter_msg(('/diagnostics', serialize_message(msg), 1))
+    new_msg = deserialize_message(data, DiagnosticArray)
+    assert (new_msg.header.frame_id == 'frame1')
+    assert (new_msg.header.stamp == msg.header.stamp)
+    assert (new_msg.status == msg.status)
+
+    msg.header.frame_id = 'other'
+    (_, data, _) = test_filter.filter_msg(('/diagnostics', serialize_message(msg), 1))
+    assert (deserialize_message(data, DiagnosticArray).header.frame_id == 'other')
+
+    (_, data, _) = test_filter.filter_msg(('/diagnostics_any', serialize_message(msg), 1))
+    new_msg = deserialize_message(data, DiagnosticArray)
+    assert (new_msg.header.frame_id == 'a_much_longer_frame')
+    assert (new_msg.status == msg.status)
+
+
+def test_frame_id_filter_length_change(monkeypatch):
+    test_filter = FrameIdFilter()
+
+    parser = argparse.ArgumentParser('frame_id')
+    test_filter.add_arguments(parser)
+    # the encoded frame_id grows by 8 bytes, so it is spliced into the serialized message
+    args = parser.parse_args(['-t', '/diagnostics', '--frame_id', 'frame0:frame0_longer1'])
+    test_filter.set_args(None, args)
+
+    topic_metadata = TopicMetadata('/diagnostics', 'diagnostic_msgs/msg/DiagnosticArray', 'cdr')
+    assert (test_filter.filter_topic(topic_metadata) == topic_metadata)
+
+    msg = DiagnosticArray()
+    msg.header.frame_id = 'frame0'
+    msg.header.stamp.sec = 1
+    msg.header.stamp.nanosec = 2
+    msg.status = [DiagnosticStatus(name='status', message='ok')]
+    data = serialize_message(msg)
+
+    def fail_deserialize(*_):
+        raise AssertionError('message was deserialized instead of patched')
+
+    monkeypatch.setattr('ros2bag_tools.filter.frame_id.deserialize_message', fail_deserialize)
+    (_, new_data, _) = test_filter.filter_msg(('/diagnostics', data, 1))
+    monkeypatch.undo()
+
+    new_msg = deserialize_message(new_data, DiagnosticArray)
+    assert (new_msg.header.frame_id == 'frame0_longer1')
+    assert (new_msg.header.stamp == msg.header.stamp)
+    assert (new_msg.status == msg.status)
+    # only the frame_id is replaced, the rest of the serialized message is kept as is
+    assert (len(new_data) == len(data) + 8)
+    assert (new_data[:12] == data[:12] and new_data[31:] == data[23:])
+
+
 def test_rename_filter():
     test_filter = RenameFilter()
 
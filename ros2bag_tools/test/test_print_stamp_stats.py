@@ -0,0 +1,47 @@
+# Copyright 2025 AIT Austrian Institute of Technology GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import struct
+
+from ros2bag_tools.verb.print_stamp_stats import TopicStats
+
+
+def serialize_stamp(sec, nanosec):
+    return struct.pack('<iI', sec, nanosec)
+
+
+def test_topic_stats_stamps():
+    stats = TopicStats()
+    stats.add_stamp(12 * 10**9 + 500, serialize_stamp(10, 0))
+    stats.add_stamp(13 * 10**9, serialize_stamp(11, 999999999))
+    stats.flush_stamps()
+    assert stats.delta_count == 2
+    assert stats.delta_sum == 3 * 10**9 + 501
+    assert stats.delta_min == 10**9 + 1
+    assert stats.delta_max == 2 * 10**9 + 500
+    assert not stats.batch_times
+    assert not stats.batch_stamps
+
+
+def test_topic_stats_zero_stamps():
+    # static transforms and unset headers have zero stamps, deltas are close to the epoch time
+    received_time_ns = 1700000000 * 10**9
+    stats = TopicStats()
+    for _ in range(10):
+        stats.add_stamp(received_time_ns, serialize_stamp(0, 0))
+    stats.flush_stamps()
+    assert stats.delta_count == 10
+    assert stats.delta_sum == 10 * received_time_ns
+    assert stats.delta_min == received_time_ns
+    assert stats.delta_max == received_time_ns